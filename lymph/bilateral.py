@@ -5,7 +5,12 @@ import numpy as np
 import pandas as pd
 
 from .unilateral import Unilateral
-from .utils import HDFMixin, draw_diagnose_times, fast_binomial_pmf
+from .utils import (
+    HDFMixin,
+    draw_diagnose_times,
+    fast_binomial_pmf,
+    find_matching_rows,
+)
 
 
 # I chose not to make this one a child of System, since it is basically only a
@@ -74,6 +79,60 @@ class Bilateral(HDFMixin):
         return self.ipsi.graph
 
 
+    @property
+    def base_symmetric(self) -> bool:
+        """If ``True``, the spread probabilities from the tumor(s) to the LNLs
+        are the same ipsi- & contralaterally.
+        """
+        return self._base_symmetric
+
+    @base_symmetric.setter
+    def base_symmetric(self, new_base_symmetric: bool):
+        """Set the base symmetry and reset the number of spread probabilities,
+        since it depends on the symmetries.
+        """
+        self._base_symmetric = new_base_symmetric
+
+        if hasattr(self, "_num_spread_probs"):
+            del self._num_spread_probs
+
+
+    @property
+    def trans_symmetric(self) -> bool:
+        """If ``True``, the spread probabilities among the LNLs are the same
+        ipsi- & contralaterally.
+        """
+        return self._trans_symmetric
+
+    @trans_symmetric.setter
+    def trans_symmetric(self, new_trans_symmetric: bool):
+        """Set the trans symmetry and reset the number of spread probabilities,
+        since it depends on the symmetries.
+        """
+        self._trans_symmetric = new_trans_symmetric
+
+        if hasattr(self, "_num_spread_probs"):
+            del self._num_spread_probs
+
+
+    @property
+    def num_spread_probs(self) -> int:
+        """Number of spread probabilities the network expects, given the
+        number of edges and the chosen symmetries. This is stored and only
+        recomputed when one of the symmetries changes.
+        """
+        try:
+            return self._num_spread_probs
+        except AttributeError:
+            num_base_probs = len(self.ipsi.base_edges)
+            num_trans_probs = len(self.ipsi.trans_edges)
+            self._num_spread_probs = (
+                (1 if self.base_symmetric else 2) * num_base_probs
+                + (1 if self.trans_symmetric else 2) * num_trans_probs
+            )
+            return self._num_spread_probs
+
+
     @property
     def system(self):
         """Return a dictionary with the ipsi- & contralateral side's
@@ -142,12 +201,17 @@ class Bilateral(HDFMixin):
         """Set the base probabilities from the tumor(s) to the LNLs.
         """
         if self.base_symmetric:
-            self.ipsi.base_probs = new_base_probs
-            self.contra.base_probs = new_base_probs
+            new_ipsi = new_contra = new_base_probs
         else:
             num_base_probs = len(self.ipsi.base_edges)
-            self.ipsi.base_probs = new_base_probs[:num_base_probs]
-            self.contra.base_probs = new_base_probs[num_base_probs:]
+            new_ipsi = new_base_probs[:num_base_probs]
+            new_contra = new_base_probs[num_base_probs:]
+
+        # unchanged sides keep their transition matrix
+        if not np.array_equal(new_ipsi, self.ipsi.base_probs):
+            self.ipsi.base_probs = new_ipsi
+        if not np.array_equal(new_contra, self.contra.base_probs):
+            self.contra.base_probs = new_contra
 
 
     @property
@@ -180,12 +244,17 @@ class Bilateral(HDFMixin):
         """Set the transmission probabilities (from LNL to LNL) of the network.
         """
         if self.trans_symmetric:
-            self.ipsi.trans_probs = new_trans_probs
-            self.contra.trans_probs = new_trans_probs
+            new_ipsi = new_contra = new_trans_probs
         else:
             num_trans_probs = len(self.ipsi.trans_edges)
-            self.ipsi.trans_probs = new_trans_probs[:num_trans_probs]
-            self.contra.trans_probs = new_trans_probs[num_trans_probs:]
+            new_ipsi = new_trans_probs[:num_trans_probs]
+            new_contra = new_trans_probs[num_trans_probs:]
+
+        # unchanged sides keep their transition matrix
+        if not np.array_equal(new_ipsi, self.ipsi.trans_probs):
+            self.ipsi.trans_probs = new_ipsi
+        if not np.array_equal(new_contra, self.contra.trans_probs):
+            self.contra.trans_probs = new_contra
 
 
     @property
@@ -213,7 +282,19 @@ class Bilateral(HDFMixin):
         See Also:
             :attr:`Unilateral.spread_probs`
         """
-        return np.concatenate([self.base_probs, self.trans_probs])
+        # the sides store their spread probs contiguously, base edges first
+        num_base_probs = len(self.ipsi.base_edges)
+        ipsi_probs = self.ipsi._spread_probs
+        contra_probs = self.contra._spread_probs
+
+        parts = [ipsi_probs[:num_base_probs]]
+        if not self.base_symmetric:
+            parts.append(contra_probs[:num_base_probs])
+        parts.append(ipsi_probs[num_base_probs:])
+        if not self.trans_symmetric:
+            parts.append(contra_probs[num_base_probs:])
+
+        return np.concatenate(parts)
 
 
     @spread_probs.setter
@@ -231,6 +312,20 @@ class Bilateral(HDFMixin):
             self.trans_probs = new_spread_probs[2*num_base_probs:]
 
 
+    def _share_transition_matrix(self):
+        """If the network is completely symmetric, both sides have the same
+        transition matrix. So, instead of computing it twice, the contralateral
+        side reuses the one of the ipsilateral side. This is called right
+        before the matrices are needed, so that setting parameters alone does
+        not compute any of them.
+        """
+        if not (self.base_symmetric and self.trans_symmetric):
+            return
+
+        if not hasattr(self.contra, "_transition_matrix"):
+            self.contra._transition_matrix = self.ipsi.transition_matrix
+
+
     @property
     def modalities(self):
         """Compute the two system's observation matrices
@@ -255,10 +350,26 @@ class Bilateral(HDFMixin):
         diagnostic modalities, compute the system's two observation matrices
         :math:`\\mathbf{B}_i` and :math:`\\mathbf{B}_c`.
         """
+        if hasattr(self, "_modalities_json"):
+            del self._modalities_json
+
         self.ipsi.modalities = modality_spsn
         self.contra.modalities = modality_spsn
 
 
+    def _share_observation_matrix(self):
+        """The observation matrix only depends on the LNLs and the modalities.
+        So, as long as the modalities of both sides are the same, the
+        contralateral side can reuse the ipsilateral observation matrix instead
+        of computing an identical one.
+        """
+        if hasattr(self.contra, "_observation_matrix"):
+            return
+
+        if self.ipsi.modalities == self.contra.modalities:
+            self.contra._observation_matrix = self.ipsi.observation_matrix
+
+
     @property
     def patient_data(self):
         """Table with rows of patients. Columns should have three levels. The
@@ -336,23 +447,17 @@ class Bilateral(HDFMixin):
             :meth:`Unilateral.load_data`: Data loading method of unilateral
             system.
         """
-        # split the DataFrame into two, one for ipsi-, one for contralateral
+        # split the DataFrame into two, one for ipsi-, one for contralateral.
+        # Dropping returns new frames, so their columns can be relabeled
+        # without copying the values again
         ipsi_data = data.drop(
             columns=["contra"], axis=1, level=1, inplace=False
         )
-        ipsi_data = pd.DataFrame(
-            ipsi_data.values,
-            index=ipsi_data.index,
-            columns=ipsi_data.columns.droplevel(1)
-        )
+        ipsi_data.columns = ipsi_data.columns.droplevel(1)
         contra_data = data.drop(
             columns=["ipsi"], axis=1, level=1, inplace=False
         )
-        contra_data = pd.DataFrame(
-            contra_data.values,
-            index=contra_data.index,
-            columns=contra_data.columns.droplevel(1)
-        )
+        contra_data.columns = contra_data.columns.droplevel(1)
 
         self.ipsi.load_data(
             ipsi_data,
@@ -371,15 +476,43 @@ class Bilateral(HDFMixin):
     def _are_valid_(self, new_spread_probs: np.ndarray) -> bool:
         """Check that the spread probability (rates) are all within limits.
         """
-        if new_spread_probs.shape != self.spread_probs.shape:
+        if new_spread_probs.shape != (self.num_spread_probs,):
             msg = ("Shape of provided spread parameters does not match network")
             raise ValueError(msg)
-        if np.any(np.greater(0., new_spread_probs)):
-            return False
-        if np.any(np.greater(new_spread_probs, 1.)):
-            return False
 
-        return True
+        return not np.any((new_spread_probs < 0.) | (new_spread_probs > 1.))
+
+
+    def _stage_log_likelihood(
+        self,
+        stage: Any,
+        state_probs: Dict[str, np.ndarray],
+        time_dist: Optional[np.ndarray] = None
+    ) -> float:
+        """Compute the log-likelihood of all patients with the T-stage
+        ``stage``, given the ipsi- & contralateral ``state_probs``, either at
+        one time or for all time steps that are then weighted by the
+        ``time_dist``.
+
+        The joint state distribution factorizes, so the per-patient likelihood
+        is the product of the two sides' projections onto the patients'
+        diagnoses. These projections do not depend on the time-prior. The
+        contralateral projection is multiplied into the ipsilateral one in
+        place, and so is the logarithm. Only marginalizing over the
+        ``time_dist`` allocates a new, smaller array.
+        """
+        patient_probs = state_probs["ipsi"] @ self.ipsi.diagnose_matrices[stage]
+        np.multiply(
+            patient_probs,
+            state_probs["contra"] @ self.contra.diagnose_matrices[stage],
+            out=patient_probs
+        )
+
+        if time_dist is not None:
+            patient_probs = time_dist @ patient_probs
+
+        np.log(patient_probs, out=patient_probs)
+        return np.sum(patient_probs)
 
 
     def _log_likelihood(
@@ -394,6 +527,7 @@ class Bilateral(HDFMixin):
         spread probs can be skipped.
         """
         llh = 0.
+        self._share_transition_matrix()
 
         if diag_times is not None:
             if len(diag_times) != len(t_stages):
@@ -410,18 +544,7 @@ class Bilateral(HDFMixin):
                 state_probs["ipsi"] = self.ipsi._evolve(diag_time)
                 state_probs["contra"] = self.contra._evolve(diag_time)
 
-                # joint probs for ipsi- & contralateral hidden states
-                joint_state_probs = np.outer(state_probs["ipsi"],
-                                             state_probs["contra"])
-                log_p = np.log(
-                    np.sum(
-                        self.ipsi.diagnose_matrices[stage]
-                        * (joint_state_probs
-                           @ self.contra.diagnose_matrices[stage]),
-                        axis=0
-                    )
-                )
-                llh += np.sum(log_p)
+                llh += self._stage_log_likelihood(stage, state_probs)
 
             return llh
 
@@ -439,20 +562,9 @@ class Bilateral(HDFMixin):
             state_probs["contra"] = self.contra._evolve(t_last=max_t)
 
             for stage in t_stages:
-                joint_state_probs = (
-                    state_probs["ipsi"].T
-                    @ np.diag(time_dists[stage])
-                    @ state_probs["contra"]
+                llh += self._stage_log_likelihood(
+                    stage, state_probs, time_dist=time_dists[stage]
                 )
-                log_p = np.log(
-                    np.sum(
-                        self.ipsi.diagnose_matrices[stage]
-                        * (joint_state_probs
-                           @ self.contra.diagnose_matrices[stage]),
-                        axis=0
-                    )
-                )
-                llh += np.sum(log_p)
 
             return llh
 
@@ -661,10 +773,10 @@ class Bilateral(HDFMixin):
         if np.any(np.greater(p, 1.)) or np.any(np.less(p, 0.)):
             return -np.inf
 
+        # evaluate the PMFs of all T-stages at once and use the rows
         t = np.arange(max_t + 1)
-        time_dists = {}
-        for i,stage in enumerate(t_stages):
-            time_dists[stage] = fast_binomial_pmf(t, max_t, p[i])
+        all_pmfs = fast_binomial_pmf(t[np.newaxis,:], max_t, p[:,np.newaxis])
+        time_dists = {stage: all_pmfs[i] for i,stage in enumerate(t_stages)}
 
         return self.marginal_log_likelihood(
             spread_probs, t_stages,
@@ -716,47 +828,146 @@ class Bilateral(HDFMixin):
         if spread_probs is not None:
             self.spread_probs = spread_probs
 
+        self._share_observation_matrix()
+
         cX = {}   # marginalize over matching complete involvements.
-        cZ = {}   # marginalize over Z for incomplete diagnoses.
-        pXt = {}  # probability p(X|t) of state X at time t as 2D matrices
         pD = {}   # probability p(D|X) of a (potentially incomplete) diagnose,
                   # given an involvement. Should be a 1D vector
 
         for side in ["ipsi", "contra"]:
-            involvement = np.array(inv[side])
             # build vector to marginalize over involvements
-            cX[side] = np.zeros(shape=(len(self.system[side].state_list)),
-                                dtype=bool)
-            for i,state in enumerate(self.system[side].state_list):
-                cX[side][i] = np.all(
-                    np.equal(
-                        involvement, state,
-                        where=(involvement!=None),
-                        out=np.ones_like(involvement, dtype=bool)
-                    )
-                )
+            cX[side] = find_matching_rows(
+                self.system[side].state_list, inv[side]
+            )
+            pD[side] = self._diagnose_prob(side, diagnoses[side])
 
-            # create one large diagnose vector from the individual modalitie's
-            # diagnoses
-            obs = np.array([])
-            for mod in self.system[side]._spsn_tables:
-                if mod in diagnoses[side]:
-                    obs = np.append(obs, diagnoses[side][mod])
-                else:
-                    obs = np.append(obs, np.array([None] * len(self.system[side].lnls)))
-
-            # build vector to marginalize over diagnoses
-            cZ[side] = np.zeros(shape=(len(self.system[side].obs_list)),
-                                dtype=bool)
-            for i,complete_obs in enumerate(self.system[side].obs_list):
-                cZ[side][i] = np.all(
-                    np.equal(
-                        obs, complete_obs,
-                        where=(obs!=None),
-                        out=np.ones_like(obs, dtype=bool)
-                    )
-                )
+        # joint probability of Xi & Xc (marginalized over time). Acts as prior
+        # for p( Di,Dc | Xi,Xc ) and should be a 2D matrix
+        pXX = self._joint_state_dist(diag_time, time_dist)
+
+        # joint probability of the requested involvement and diagnosis. The
+        # selectors cX are folded into the diagnose probabilities
+        pDDII = (
+            (cX["ipsi"] * pD["ipsi"])
+            @ pXX
+            @ (cX["contra"] * pD["contra"])
+        )
+
+        # denominator p(Di, Dc). Joint probability for ipsi- & contralateral
+        # diagnoses. Marginalized over all hidden involvements and over all
+        # matching complete observations that give rise to the specific
+        # diagnose. The latter is already done in pD. The result should be
+        # just a number
+        pDD = pD["ipsi"] @ pXX @ pD["contra"]
+
+        return pDDII / pDD
 
+
+    def risk_batch(
+        self,
+        spread_probs: Optional[np.ndarray] = None,
+        inv_batch: List[Dict[str, Optional[np.ndarray]]] = [],
+        diagnoses_batch: List[Dict[str, Dict]] = [],
+        diag_time: Optional[int] = None,
+        time_dist: Optional[np.ndarray] = None,
+        mode: str = "HMM"
+    ) -> np.ndarray:
+        """Compute the risk for a whole batch of involvements of interest and
+        diagnoses at once. Since the spread parameters and the time prior are
+        shared, the joint distribution over ipsi- & contralateral states is
+        computed only once and all risks are obtained from stacked 2D arrays.
+
+        Args:
+            spread_probs: Set of new spread parameters. If not given (``None``),
+                the currently set parameters will be used.
+
+            inv_batch: List of dictionaries with the involvements of interest,
+                each in the format of the ``inv`` argument of :meth:`risk`.
+
+            diagnoses_batch: List of dictionaries with the diagnoses, each in
+                the format of the ``diagnoses`` argument of :meth:`risk`. Must
+                be as long as ``inv_batch``.
+
+            diag_time: Time of diagnosis. Either this or the `time_dist` to
+                marginalize over diagnose times must be given.
+
+            time_dist: Distribution to marginalize over diagnose times. Either
+                this, or the `diag_time` must be given.
+
+            mode: Set to ``"HMM"`` for the hidden Markov model risk (requires
+                the ``time_dist``) or to ``"BN"`` for the Bayesian network
+                version.
+
+        Returns:
+            An array with one risk for every pair of involvement and diagnoses.
+
+        See Also:
+            :meth:`risk`: Compute the risk for a single involvement of interest
+            and diagnosis.
+        """
+        if len(inv_batch) != len(diagnoses_batch):
+            msg = ("There must be exactly one set of diagnoses for every "
+                   "involvement of interest.")
+            raise ValueError(msg)
+
+        if spread_probs is not None:
+            self.spread_probs = spread_probs
+
+        self._share_observation_matrix()
+
+        cX = {}   # rows of 0/1 selectors for the involvements of interest
+        pD = {}   # rows of diagnose probabilities p(D|X)
+
+        for side in ["ipsi", "contra"]:
+            state_list = self.system[side].state_list
+            cX[side] = np.array([
+                find_matching_rows(state_list, inv[side]) for inv in inv_batch
+            ]).reshape(len(inv_batch), len(state_list))
+            pD[side] = np.array([
+                self._diagnose_prob(side, diagnoses[side])
+                for diagnoses in diagnoses_batch
+            ]).reshape(len(diagnoses_batch), len(state_list))
+
+        pXX = self._joint_state_dist(diag_time, time_dist)
+
+        # row-wise versions of pDDII and pDD from the `risk` method
+        pDDII = np.sum(
+            ((cX["ipsi"] * pD["ipsi"]) @ pXX) * cX["contra"] * pD["contra"],
+            axis=1
+        )
+        pDD = np.sum((pD["ipsi"] @ pXX) * pD["contra"], axis=1)
+
+        return pDDII / pDD
+
+
+    def _diagnose_prob(self, side: str, diagnoses: Dict) -> np.ndarray:
+        """Compute the probability p(D|X) of a (potentially incomplete)
+        diagnose for one ``side``, given each of its hidden states.
+        """
+        # create one large diagnose vector from the individual modalitie's
+        # diagnoses
+        obs = self.system[side]._join_diagnoses(diagnoses)
+
+        # build vector to marginalize over diagnoses
+        cZ = find_matching_rows(self.system[side].obs_list, obs)
+
+        # cZ is a 0/1 selector, so only sum the columns it selects
+        return np.sum(self.system[side].observation_matrix[:,cZ], axis=1)
+
+
+    def _joint_state_dist(
+        self,
+        diag_time: Optional[int] = None,
+        time_dist: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Compute the joint probability of ipsi- & contralateral hidden
+        states, either at the time of diagnosis or marginalized over the
+        diagnose times using the time-prior.
+        """
+        self._share_transition_matrix()
+        pXt = {}  # probability p(X|t) of state X at time t as 2D matrices
+
+        for side in ["ipsi", "contra"]:
             if diag_time is not None:
                 pXt[side] = self.system[side]._evolve(diag_time)
 
@@ -769,34 +980,12 @@ class Bilateral(HDFMixin):
                        "over it must be given.")
                 raise ValueError(msg)
 
-            pD[side] = self.system[side].observation_matrix @ cZ[side]
-
-        # joint probability of Xi & Xc (marginalized over time). Acts as prior
-        # for p( Di,Dc | Xi,Xc ) and should be a 2D matrix
         if diag_time is not None:
-            pXX = np.outer(pXt["ipsi"], pXt["contra"])
+            return np.outer(pXt["ipsi"], pXt["contra"])
 
-        elif time_dist is not None:
-            # time-prior in diagnoal matrix form
-            PT = np.diag(time_dist)
-            pXX = pXt["ipsi"].T @ PT @ pXt["contra"]
-
-        # joint probability of all hidden states and the requested diagnosis
-        pDDXX = np.einsum("i,ij,j->ij", pD["ipsi"], pXX, pD["contra"])
-        # joint probability of the requested involvement and diagnosis
-        pDDII = cX["ipsi"].T @ pDDXX @ cX["contra"]
-
-        # denominator p(Di, Dc). Joint probability for ipsi- & contralateral
-        # diagnoses. Marginalized over all hidden involvements and over all
-        # matching complete observations that give rise to the specific
-        # diagnose. The result should be just a number
-        pDD = (cZ["ipsi"].T
-               @ self.ipsi.observation_matrix.T
-               @ pXX
-               @ self.contra.observation_matrix
-               @ cZ["contra"])
-
-        return pDDII / pDD
+        # scaling the columns with the time-prior is the same as
+        # multiplying with it in diagonal matrix form
+        return (pXt["ipsi"].T * time_dist) @ pXt["contra"]
 
 
     def generate_dataset(
@@ -825,6 +1014,8 @@ class Bilateral(HDFMixin):
             time_dists=time_dists
         )
 
+        self._share_transition_matrix()
+        self._share_observation_matrix()
         drawn_obs_ipsi = self.ipsi._draw_patient_diagnoses(drawn_diag_times)
         drawn_obs_contra = self.contra._draw_patient_diagnoses(drawn_diag_times)
         drawn_obs = np.concatenate([drawn_obs_ipsi, drawn_obs_contra], axis=1)
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import numpy as np
+
 from .node import Node
 
 
@@ -27,6 +29,10 @@ class Edge(object):
         self.start.out.append(self)
         self.end = end
         self.end.inc.append(self)
+
+        # the transition probability lives in a (possibly shared) array
+        self._buffer = np.zeros(shape=(1,), dtype=float)
+        self._index = 0
         self.t = t
 
 
@@ -34,13 +40,23 @@ class Edge(object):
         """Print basic info"""
         return f"{self.start}-{100 * self.t:.1f}%->{self.end}"
 
+    def _share_buffer(self, buffer: np.ndarray, index: int):
+        """Store the transition probability at position ``index`` of the
+        array ``buffer`` from now on. This allows e.g. a :class:`Unilateral`
+        instance to hold the spread probabilities of all its edges in one
+        contiguous array.
+        """
+        buffer[index] = self.t
+        self._buffer = buffer
+        self._index = index
+
     @property
     def t(self):
-        return self._t
+        return self._buffer[self._index]
 
     @t.setter
     def t(self, new_t: float):
         if new_t <= 1. and new_t >= 0.:
-            self._t = new_t
+            self._buffer[self._index] = new_t
         else:
             raise ValueError("Transmission probability must be between 0 and 1")
\ No newline at end of file
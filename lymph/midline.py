@@ -186,6 +186,9 @@ class MidlineBilateral(HDFMixin):
         """Call the respective getter and setter methods of the bilateral
         components with and without midline extension.
         """
+        if hasattr(self, "_modalities_json"):
+            del self._modalities_json
+
         self.noext.modalities = modality_spsn
         self.ext.modalities = modality_spsn
 
@@ -306,15 +309,12 @@ class MidlineBilateral(HDFMixin):
     def _are_valid_(self, new_spread_probs: np.ndarray) -> bool:
         """Check that the spread probability (rates) are all within limits.
         """
-        if new_spread_probs.shape != self.spread_probs.shape:
+        # the spread probs of the lateralized model plus the mixing parameter
+        if new_spread_probs.shape != (self.noext.num_spread_probs + 1,):
             msg = ("Shape of provided spread parameters does not match network")
             raise ValueError(msg)
-        if np.any(np.greater(0., new_spread_probs)):
-            return False
-        if np.any(np.greater(new_spread_probs, 1.)):
-            return False
 
-        return True
+        return not np.any((new_spread_probs < 0.) | (new_spread_probs > 1.))
 
 
     def log_likelihood(
@@ -474,10 +474,10 @@ class MidlineBilateral(HDFMixin):
         if np.any(np.greater(p, 1.)) or np.any(np.less(p, 0.)):
             return -np.inf
 
+        # evaluate the PMFs of all T-stages at once and use the rows
         t = np.arange(max_t + 1)
-        time_dists = {}
-        for i,stage in enumerate(t_stages):
-            time_dists[stage] = fast_binomial_pmf(t, max_t, p[i])
+        all_pmfs = fast_binomial_pmf(t[np.newaxis,:], max_t, p[:,np.newaxis])
+        time_dists = {stage: all_pmfs[i] for i,stage in enumerate(t_stages)}
 
         return self.marginal_log_likelihood(
             spread_probs, t_stages,
@@ -1,4 +1,5 @@
 import warnings
+from collections import OrderedDict
 from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 import numpy as np
@@ -7,7 +8,7 @@ from numpy.linalg import matrix_power as mat_pow
 
 from .edge import Edge
 from .node import Node
-from .utils import HDFMixin, change_base, draw_diagnose_times
+from .utils import HDFMixin, draw_diagnose_times, find_matching_rows
 
 
 class Unilateral(HDFMixin):
@@ -15,6 +16,9 @@ class Unilateral(HDFMixin):
     representing it as a directed graph. The progression itself can be modelled
     via hidden Markov models (HMM) or Bayesian networks (BN).
     """
+    # maximum number of evolved state distributions that `_evolve` caches
+    _EVOLVE_CACHE_SIZE = 4
+
     def __init__(self, graph: Dict[Tuple[str], Set[str]] = {}, **kwargs):
         """Initialize the underlying graph:
 
@@ -33,10 +37,15 @@ class Unilateral(HDFMixin):
         self.tumors = []       # list of nodes with type tumour
         self.lnls = []         # list of all lymph node levels
 
+        # lookup by name, to avoid searching the node list for every edge
+        node_dict = {}
+
         for key in graph:
-            self.nodes.append(Node(name=key[1], typ=key[0]))
+            node = Node(name=key[1], typ=key[0])
+            # like `find_node`, the first node with a given name wins
+            node_dict.setdefault(node.name, node)
+            self.nodes.append(node)
 
-        for node in self.nodes:
             if node.typ == "tumor":
                 self.tumors.append(node)
             else:
@@ -47,15 +56,24 @@ class Unilateral(HDFMixin):
         self.trans_edges = []  # list of edges, connecting LNLs
 
         for key, values in graph.items():
+            start = node_dict[key[1]]
             for value in set(values):
-                self.edges.append(Edge(self.find_node(key[1]),
-                                       self.find_node(value)))
+                edge = Edge(start, node_dict.get(value))
+                self.edges.append(edge)
 
-        for edge in self.edges:
-            if edge.start.typ == "tumor":
-                self.base_edges.append(edge)
-            else:
-                self.trans_edges.append(edge)
+                if start.typ == "tumor":
+                    self.base_edges.append(edge)
+                else:
+                    self.trans_edges.append(edge)
+
+        # spread probs of all edges (base edges first) in one contiguous array
+        # that the edges read from and write to
+        self._spread_probs = np.zeros(shape=(len(self.edges),), dtype=float)
+        for i, edge in enumerate(self.base_edges + self.trans_edges):
+            edge._share_buffer(self._spread_probs, i)
+
+        # bounded FIFO cache of state evolutions, see :meth:`_evolve`
+        self._evolve_cache = OrderedDict()
 
 
     def __str__(self):
@@ -136,18 +154,16 @@ class Unilateral(HDFMixin):
         values, the transition matrix - if it was precomputed - is deleted
         so it can be recomputed with the new parameters.
         """
-        return np.array([edge.t for edge in self.base_edges], dtype=float)
+        return self._spread_probs[:len(self.base_edges)].copy()
 
     @base_probs.setter
     def base_probs(self, new_base_probs):
         """Set the spread probabilities for the connections from the tumor to
         the LNLs.
         """
-        for i, edge in enumerate(self.base_edges):
-            edge.t = new_base_probs[i]
-
-        if hasattr(self, "_transition_matrix"):
-            del self._transition_matrix
+        self._set_spread_probs_slice(
+            slice(0, len(self.base_edges)), new_base_probs
+        )
 
 
     @property
@@ -165,17 +181,15 @@ class Unilateral(HDFMixin):
         matrix - if previously computed - is deleted again, so that it will be
         recomputed with the new parameters.
         """
-        return np.array([edge.t for edge in self.trans_edges], dtype=float)
+        return self._spread_probs[len(self.base_edges):].copy()
 
     @trans_probs.setter
     def trans_probs(self, new_trans_probs):
         """Set the spread probabilities for the connections among the LNLs.
         """
-        for i, edge in enumerate(self.trans_edges):
-            edge.t = new_trans_probs[i]
-
-        if hasattr(self, "_transition_matrix"):
-            del self._transition_matrix
+        self._set_spread_probs_slice(
+            slice(len(self.base_edges), None), new_trans_probs
+        )
 
 
     @property
@@ -189,17 +203,31 @@ class Unilateral(HDFMixin):
         edges in the network. It's essentially a concatenation of the
         :attr:`base_probs` and the :attr:`trans_probs`.
         """
-        return np.concatenate([self.base_probs, self.trans_probs])
+        return self._spread_probs.copy()
 
     @spread_probs.setter
     def spread_probs(self, new_spread_probs: np.ndarray):
         """Set the spread probabilities of the :class:`Edge` instances in the
         the network in the order they were created from the graph.
         """
-        num_base_edges = len(self.base_edges)
+        self._set_spread_probs_slice(slice(None), new_spread_probs)
+
+
+    def _set_spread_probs_slice(self, where: slice, new_probs: np.ndarray):
+        """Write new spread probabilities into the part ``where`` of the array
+        that all edges share and delete the transition matrix, if it was
+        previously computed.
+        """
+        new_probs = np.asarray(new_probs, dtype=float)
+        # this also catches NaNs
+        if not np.all((0. <= new_probs) & (new_probs <= 1.)):
+            msg = ("Transmission probability must be between 0 and 1")
+            raise ValueError(msg)
+
+        self._spread_probs[where] = new_probs
 
-        self.base_probs = new_spread_probs[:num_base_edges]
-        self.trans_probs = new_spread_probs[num_base_edges:]
+        if hasattr(self, "_transition_matrix"):
+            del self._transition_matrix
 
 
     def comp_transition_prob(
@@ -280,14 +308,14 @@ class Unilateral(HDFMixin):
     def _gen_state_list(self):
         """Generates the list of (hidden) states.
         """
-        if not hasattr(self, "_state_list"):
-            self._state_list = np.zeros(
-                shape=(2**len(self.lnls), len(self.lnls)), dtype=int
-            )
-        for i in range(2**len(self.lnls)):
-            self._state_list[i] = [
-                int(digit) for digit in change_base(i, 2, length=len(self.lnls))
-            ]
+        num_lnls = len(self.lnls)
+        # the i-th state is the binary representation of i, with the first
+        # LNL corresponding to the most significant bit
+        numbers = np.arange(2**num_lnls)[:,np.newaxis]
+        shifts = np.arange(num_lnls - 1, -1, -1)
+        self._state_list = np.ascontiguousarray(
+            (numbers >> shifts) & 1, dtype=np.int8
+        )
 
     @property
     def state_list(self):
@@ -304,18 +332,18 @@ class Unilateral(HDFMixin):
         """Generates the list of possible observations.
         """
         n_obs = len(self._spsn_tables)
+        num_lnls = len(self.lnls)
+        num_digits = n_obs * num_lnls
 
-        if not hasattr(self, "_obs_list"):
-            self._obs_list = np.zeros(
-                shape=(2**(n_obs * len(self.lnls)), n_obs * len(self.lnls)),
-                dtype=int
-            )
+        # binary representations of all observations, grouped by modality...
+        numbers = np.arange(2**num_digits)[:,np.newaxis]
+        shifts = np.arange(num_digits - 1, -1, -1)
+        digits = ((numbers >> shifts) & 1).reshape(-1, n_obs, num_lnls)
 
-        for i in range(2**(n_obs * len(self.lnls))):
-            tmp = change_base(i, 2, reverse=False, length=n_obs * len(self.lnls))
-            for j in range(len(self.lnls)):
-                for k in range(n_obs):
-                    self._obs_list[i,(j*n_obs)+k] = int(tmp[k*len(self.lnls)+j])
+        # ...but stored grouped by LNL
+        self._obs_list = np.ascontiguousarray(
+            digits.transpose(0, 2, 1).reshape(-1, num_digits), dtype=np.int8
+        )
 
     @property
     def obs_list(self):
@@ -450,6 +478,8 @@ class Unilateral(HDFMixin):
             del self._observation_matrix
         if hasattr(self, "_obs_list"):
             del self._obs_list
+        if hasattr(self, "_modalities_json"):
+            del self._modalities_json
 
         self._spsn_tables = {}
         for mod, spsn in modality_spsn.items():
@@ -675,6 +705,14 @@ class Unilateral(HDFMixin):
 
         :meta public:
         """
+        # the evolution only depends on the spread probs, so it can be reused
+        # e.g. when computing the risk after the likelihood with same params
+        key = (self._spread_probs.tobytes(), t_first, t_last)
+        try:
+            return self._evolve_cache[key]
+        except KeyError:
+            pass
+
         # All healthy state at beginning
         start_state = np.zeros(shape=len(self.state_list), dtype=float)
         start_state[0] = 1.
@@ -683,24 +721,32 @@ class Unilateral(HDFMixin):
         state = start_state @ mat_pow(self.transition_matrix, t_first)
 
         if t_last is None:
-            return state
+            state_probs = state
 
-        len_time_range = t_last - t_first
-        if len_time_range < 0:
-            msg = ("Starting time must be smaller than ending time.")
-            raise ValueError(msg)
+        else:
+            len_time_range = t_last - t_first
+            if len_time_range < 0:
+                msg = ("Starting time must be smaller than ending time.")
+                raise ValueError(msg)
 
-        state_probs = np.zeros(
-            shape=(len_time_range + 1, len(self.state_list)),
-            dtype=float
-        )
+            state_probs = np.zeros(
+                shape=(len_time_range + 1, len(self.state_list)),
+                dtype=float
+            )
 
-        # compute subsequent time-steps, effectively incrementing time until end
-        for i in range(len_time_range):
-            state_probs[i] = state
-            state = state @ self.transition_matrix
+            # compute subsequent time-steps, effectively incrementing time
+            # until end
+            for i in range(len_time_range):
+                state_probs[i] = state
+                state = state @ self.transition_matrix
 
-        state_probs[-1] = state
+            state_probs[-1] = state
+
+        # cached arrays are shared, so they must not be modified in-place
+        state_probs.flags.writeable = False
+        self._evolve_cache[key] = state_probs
+        if len(self._evolve_cache) > self._EVOLVE_CACHE_SIZE:
+            self._evolve_cache.popitem(last=False)
 
         return state_probs
 
@@ -708,15 +754,11 @@ class Unilateral(HDFMixin):
     def _are_valid_(self, new_spread_probs: np.ndarray) -> bool:
         """Check that the spread probability (rates) are all within limits.
         """
-        if new_spread_probs.shape != self.spread_probs.shape:
+        if new_spread_probs.shape != self._spread_probs.shape:
             msg = ("Shape of provided spread parameters does not match network")
             raise ValueError(msg)
-        if np.any(0. > new_spread_probs):
-            return False
-        if np.any(new_spread_probs > 1.):
-            return False
 
-        return True
+        return not np.any((new_spread_probs < 0.) | (new_spread_probs > 1.))
 
 
     def log_likelihood(
@@ -801,8 +843,12 @@ class Unilateral(HDFMixin):
                 # subtract 1, to also consider healthy starting state (t = 0)
                 max_t = len(time_dists[t_stages[0]]) - 1
 
-                for stage in t_stages:
-                    state_probs[stage] = time_dists[stage] @ self._evolve(t_last=max_t)
+                # marginalize over the diagnose times of all T-stages at once
+                stacked_time_dists = np.stack(
+                    [time_dists[stage] for stage in t_stages]
+                )
+                marg_state_probs = stacked_time_dists @ self._evolve(t_last=max_t)
+                state_probs = dict(zip(t_stages, marg_state_probs))
 
             else:
                 raise ValueError(
@@ -898,6 +944,20 @@ class Unilateral(HDFMixin):
         )
 
 
+    def _join_diagnoses(self, diagnoses: Dict[str, np.ndarray]) -> np.ndarray:
+        """Create one large diagnose vector from the individual (potentially
+        incomplete) diagnoses of each modality, in the order the modalities
+        are stored. Missing modalities are filled with ``None``.
+        """
+        num_lnls = len(self.lnls)
+        obs = np.full(shape=(len(self._spsn_tables) * num_lnls,), fill_value=None)
+        for i, mod in enumerate(self._spsn_tables):
+            if mod in diagnoses:
+                obs[i * num_lnls:(i + 1) * num_lnls] = diagnoses[mod]
+
+        return obs
+
+
     def risk(
         self,
         spread_probs: Optional[np.ndarray] = None,
@@ -944,12 +1004,7 @@ class Unilateral(HDFMixin):
 
         # create one large diagnose vector from the individual modalitie's
         # diagnoses
-        obs = np.array([])
-        for mod in self._spsn_tables:
-            if mod in diagnoses:
-                obs = np.append(obs, diagnoses[mod])
-            else:
-                obs = np.append(obs, np.array([None] * len(self.lnls)))
+        obs = self._join_diagnoses(diagnoses)
 
         # vector of probabilities of arriving in state x, marginalized over time
         # HMM version
@@ -984,15 +1039,12 @@ class Unilateral(HDFMixin):
         pZ = pX @ self.observation_matrix
 
         # build vector to marginalize over diagnoses
-        cZ = np.zeros(shape=(len(pZ)), dtype=bool)
-        for i,complete_obs in enumerate(self.obs_list):
-            cZ[i] = np.all(np.equal(obs, complete_obs,
-                                    where=(obs!=None),
-                                    out=np.ones_like(obs, dtype=bool)))
+        cZ = find_matching_rows(self.obs_list, obs)
 
         # compute vector of probabilities for all possible involvements given
-        # the specified diagnosis
-        res =  cZ @ pZX / (cZ @ pZ)
+        # the specified diagnosis. Since cZ merely selects observations, only
+        # the matching rows need to be summed up
+        res = np.sum(pZX[cZ], axis=0) / np.sum(pZ[cZ])
 
         if inv is None:
             return res
@@ -1000,12 +1052,7 @@ class Unilateral(HDFMixin):
             # if a specific involvement of interest is provided, marginalize the
             # resulting vector of hidden states to match that involvement of
             # interest
-            inv = np.array(inv)
-            cX = np.zeros(shape=res.shape, dtype=bool)
-            for i,state in enumerate(self.state_list):
-                cX[i] = np.all(np.equal(inv, state,
-                                        where=(inv!=None),
-                                        out=np.ones_like(state, dtype=bool)))
+            cX = find_matching_rows(self.state_list, inv)
             return cX @ res
 
 
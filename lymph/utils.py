@@ -9,7 +9,8 @@ import emcee
 import h5py
 import numpy as np
 import pandas as pd
-from scipy.special import factorial as fact
+from emcee.pbar import get_progress_bar
+from scipy.special import gammaln, xlog1py, xlogy
 
 import lymph
 
@@ -57,18 +58,32 @@ def lyprox_to_lymph(
     midline_extension_data = data[("tumor", "1", "extension")]
     diagnostic_data = data[modalities].drop(columns=["date"], level=2)
 
+    # select the ipsilateral diagnoses and drop the side level in one go,
+    # before the info columns (which have no side) are added
+    if method == "unilateral":
+        diagnostic_data = diagnostic_data.xs("ipsi", axis=1, level=1)
+        t_stage_column = ("info", "t_stage")
+    else:
+        t_stage_column = ("info", "tumor", "t_stage")
+
     if convert_t_stage is not None:
-        diagnostic_data[("info", "tumor", "t_stage")] = [
-            convert_t_stage[t] for t in t_stage_data.values
-        ]
+        converted = t_stage_data.map(convert_t_stage)
+        # `map` silently turns T-stages missing from the dict into NaN. Like
+        # a lookup in the dict, this must fail, also for missing T-stages
+        is_unmapped = converted.isna()
+        if is_unmapped.any():
+            unmapped = t_stage_data[is_unmapped].unique().tolist()
+            msg = (
+                f"T-stages {unmapped} cannot be converted with the provided "
+                "`convert_t_stage` dictionary."
+            )
+            raise KeyError(msg)
+        diagnostic_data[t_stage_column] = converted
     else:
-        diagnostic_data[("info", "tumor", "t_stage")] = t_stage_data
+        diagnostic_data[t_stage_column] = t_stage_data
 
     if method == "midline":
         diagnostic_data[("info", "tumor", "midline_extension")] = midline_extension_data
-    elif method == "unilateral":
-        diagnostic_data = diagnostic_data.drop(columns=["contra"], level=1)
-        diagnostic_data.columns = diagnostic_data.columns.droplevel(1)
 
     return diagnostic_data
 
@@ -139,7 +154,7 @@ class EnsembleSampler(emcee.EnsembleSampler):
                 method.
 
         Returns:
-            A list of mean autocorrelation times, computed every
+            An array of mean autocorrelation times, computed every
             ``check_interval`` samples.
         """
         if verbose:
@@ -150,33 +165,44 @@ class EnsembleSampler(emcee.EnsembleSampler):
             size=(self.nwalkers, self.ndim)
         )
 
-        acor_list = []
+        acor_list = np.empty(shape=max_steps // check_interval + 1)
         old_acor = np.inf
         idx = 0
         is_converged = False
 
-        for sample in self.sample(start, iterations=max_steps, progress=verbose, **kwargs):
-            # after `check_interval` number of samples...
-            if self.iteration % check_interval:
-                continue
+        state = start
+        num_checks, num_remaining = divmod(max_steps, check_interval)
 
-            # ...compute the autocorrelation time and store it in an array.
-            new_acor = self.get_autocorr_time(tol=0)
-            acor_list.append(np.mean(new_acor))
-            idx += 1
+        # one progress bar for the whole run, the chunks themselves are silent
+        with get_progress_bar(verbose, max_steps) as progress_bar:
+            for _ in range(num_checks):
+                # after sampling `check_interval` steps in one go...
+                state = self.run_mcmc(
+                    state, check_interval, progress=False, **kwargs
+                )
+                progress_bar.update(check_interval)
 
-            # check convergence based on two criterions:
-            # - has the acor time crossed the N / `trust_theshold` line?
-            # - did the acor time stay stable?
-            is_converged = np.all(new_acor * trust_threshold < self.iteration)
-            rel_acor_diff = np.abs(old_acor - new_acor) / new_acor
-            is_converged &= np.all(rel_acor_diff < rel_acor_threshold)
+                # ...compute the autocorrelation time and store it in an array.
+                new_acor = self.get_autocorr_time(tol=0)
+                acor_list[idx] = new_acor.mean()
+                idx += 1
 
-            # if it has converged, stop
-            if is_converged:
-                break
+                # check convergence based on two criterions:
+                # - has the acor time crossed the N / `trust_theshold` line?
+                # - did the acor time stay stable?
+                is_converged = np.all(new_acor * trust_threshold < self.iteration)
+                rel_acor_diff = np.abs(old_acor - new_acor) / np.maximum(new_acor, 1e-12)
+                is_converged &= np.all(rel_acor_diff < rel_acor_threshold)
 
-            old_acor = new_acor
+                # if it has converged, stop
+                if is_converged:
+                    break
+
+                old_acor = new_acor
+
+            if not is_converged and num_remaining > 0:
+                self.run_mcmc(state, num_remaining, progress=False, **kwargs)
+                progress_bar.update(num_remaining)
 
         if verbose:
             if is_converged:
@@ -186,31 +212,26 @@ class EnsembleSampler(emcee.EnsembleSampler):
 
             acc_frac = 100 * np.mean(self.acceptance_fraction)
             print(f"Acceptance fraction = {acc_frac:.2f}%")
-            print(f"Mean autocorrelation time = {np.mean(old_acor):.2f}")
+            mean_acor = acor_list[idx - 1] if idx > 0 else np.inf
+            print(f"Mean autocorrelation time = {mean_acor:.2f}")
 
-        return acor_list
+        return acor_list[:idx]
 
 
 def tupledict_to_jsondict(dict: Dict[Tuple[str], List[str]]) -> Dict[str, List[str]]:
     """Take a dictionary that has tuples as keys and stringify those keys so
     that it can be serialized to JSON.
     """
-    jsondict = {}
-    for k, v in dict.items():
-        if np.any([',' in s for s in k]):
-            raise ValueError("Strings in in key tuple must not contain commas")
+    if any(',' in s for k in dict for s in k):
+        raise ValueError("Strings in in key tuple must not contain commas")
 
-        jsondict[",".join(k)] = v
-    return jsondict
+    return {",".join(k): v for k, v in dict.items()}
 
 def jsondict_to_tupledict(dict: Dict[str, List[str]]) -> Dict[Tuple[str], List[str]]:
     """Take a serialized JSON dictionary where the keys are strings of
     comma-separated names and convert them into keys of tuples.
     """
-    tupledict = {}
-    for k, v in dict.items():
-        tupledict[tuple(n for n in k.split(","))] = v
-    return tupledict
+    return {tuple(k.split(",")): v for k, v in dict.items()}
 
 
 class HDFMixin(object):
@@ -222,6 +243,26 @@ class HDFMixin(object):
     patient_data: pd.DataFrame
     modalities: Dict[str, List[float]]
 
+    def _get_graph_json(self) -> str:
+        """Return the graph serialized as JSON string. Since the graph cannot
+        change after the system has been created, this is only done once.
+        """
+        try:
+            return self._graph_json
+        except AttributeError:
+            self._graph_json = json.dumps(tupledict_to_jsondict(self.graph))
+            return self._graph_json
+
+    def _get_modalities_json(self) -> str:
+        """Return the modalities serialized as JSON string. The string is
+        cached until new modalities are set.
+        """
+        try:
+            return self._modalities_json
+        except AttributeError:
+            self._modalities_json = json.dumps(self.modalities)
+            return self._modalities_json
+
     def to_hdf(
         self,
         filename: str,
@@ -235,13 +276,13 @@ class HDFMixin(object):
             name: Name of the group where the info is supposed to be
                 stored.
         """
-        filename = Path(filename).resolve()
+        filename = Path(filename)
 
         with h5py.File(filename, 'a') as file:
             group = file.require_group(f"{name}")
             group.attrs["class"] = self.__class__.__name__
-            group.attrs["graph"] = json.dumps(tupledict_to_jsondict(self.graph))
-            group.attrs["modalities"] = json.dumps(self.modalities)
+            group.attrs["graph"] = self._get_graph_json()
+            group.attrs["modalities"] = self._get_modalities_json()
             group.attrs["base_symmetric"] = getattr(
                 self, "base_symmetric", "None"
             )
@@ -249,13 +290,172 @@ class HDFMixin(object):
                 self, "trans_symmetric", "None"
             )
 
-        with pd.HDFStore(filename, 'a') as store:
-            store.put(
-                key=f"{name}/patient_data",
-                value=self.patient_data,
-                format="fixed",     # due to MultiIndex this needs to be fixed
-                data_columns=None
-            )
+            # overwrite previously stored data, which might be in pandas format
+            if "patient_data" in group:
+                del group["patient_data"]
+            try:
+                write_dataframe(
+                    group.create_group("patient_data"), self.patient_data
+                )
+                needs_pandas_format = False
+            except TypeError:
+                del group["patient_data"]
+                needs_pandas_format = True
+
+        # data that cannot be stored column by column is left to pandas
+        if needs_pandas_format:
+            with pd.HDFStore(filename, 'a') as store:
+                store.put(
+                    key=f"{name}/patient_data",
+                    value=self.patient_data,
+                    format="fixed",     # due to MultiIndex this needs to be fixed
+                    data_columns=None
+                )
+
+
+# chunks of about 1 MB fit into HDF5's default chunk cache
+_HDF5_CHUNK_BYTES = 2**20
+
+
+def _json_default(obj: Any) -> Any:
+    """Make NumPy scalars (e.g. the ``np.bool_`` of diagnoses) JSON
+    serializable. Anything else is refused with a ``TypeError``.
+    """
+    if isinstance(obj, (np.bool_, np.integer, np.floating)):
+        return obj.item()
+
+    msg = (f"Object of type {type(obj).__name__} cannot be stored as JSON")
+    raise TypeError(msg)
+
+
+def _encode_column(values: Union[pd.Series, pd.Index]) -> Tuple[Any, str]:
+    """Convert a column (or the index) of a :class:`DataFrame` into what is
+    stored in the HDF5 file, together with the name of its dtype.
+
+    Numerical columns are kept as arrays, date- and timedeltas are stored as
+    their integer representation and object columns (e.g. with the ``None`` of
+    missing diagnoses or strings) are encoded as JSON.
+
+    Raises:
+        TypeError: If the column cannot be stored without losing information,
+            e.g. because it has a pandas extension dtype.
+    """
+    if not isinstance(values.dtype, np.dtype):
+        msg = (f"Columns of dtype {values.dtype} are not supported")
+        raise TypeError(msg)
+
+    array = values.to_numpy()
+    if array.dtype.kind in "biuf":
+        return array, str(array.dtype)
+    if array.dtype.kind in "mM":
+        return array.view(np.int64), str(array.dtype)
+    if array.dtype.kind in "OU":
+        return json.dumps(array.tolist(), default=_json_default), str(array.dtype)
+
+    msg = (f"Columns of dtype {array.dtype} are not supported")
+    raise TypeError(msg)
+
+
+def _write_column(group: h5py.Group, key: str, payload: Any, dtype: str):
+    """Write an encoded column as dataset ``key`` into ``group`` and remember
+    its original ``dtype``. Numerical columns are stored in compressed chunks
+    of about 1 MB.
+    """
+    if isinstance(payload, str) or len(payload) == 0:
+        dataset = group.create_dataset(key, data=payload)
+    else:
+        rows_per_chunk = _HDF5_CHUNK_BYTES // payload.dtype.itemsize
+        dataset = group.create_dataset(
+            key, data=payload,
+            chunks=(min(len(payload), rows_per_chunk),),
+            compression="gzip", compression_opts=1, shuffle=True,
+        )
+    dataset.attrs["dtype"] = dtype
+
+
+def _read_column(dataset: h5py.Dataset) -> np.ndarray:
+    """Read a column that was written by :func:`_write_column` and restore its
+    original dtype.
+    """
+    dtype = np.dtype(dataset.attrs["dtype"])
+
+    if dataset.dtype.kind == "O":
+        values = json.loads(dataset.asstr()[()])
+        column = np.empty(shape=(len(values),), dtype=object)
+        column[:] = values
+        return column.astype(dtype, copy=False)
+
+    if dtype.kind in "mM":
+        return dataset[()].view(dtype)
+
+    return dataset[()]
+
+
+def write_dataframe(group: h5py.Group, table: pd.DataFrame):
+    """Store a :class:`DataFrame` in an HDF5 ``group``, with one dataset per
+    column. The (possibly multi-level) column labels are stored as JSON in the
+    group's attributes.
+
+    Args:
+        group: Empty HDF5 group to store the table in.
+        table: The :class:`DataFrame` to store.
+
+    Raises:
+        TypeError: If the index or any column cannot be represented. In that
+            case, nothing is written into ``group``.
+
+    See Also:
+        :func:`read_dataframe`: Recover the stored :class:`DataFrame`.
+    """
+    if isinstance(table.index, pd.MultiIndex):
+        msg = ("Tables with a MultiIndex as row index are not supported")
+        raise TypeError(msg)
+
+    # encode everything first, so that unsupported data leaves no traces
+    encoded_index = _encode_column(table.index)
+    encoded_columns = [_encode_column(column) for _, column in table.items()]
+
+    group.attrs["format"] = "lymph"
+    group.attrs["columns"] = json.dumps([
+        list(col) if isinstance(col, tuple) else [col] for col in table.columns
+    ], default=_json_default)
+    group.attrs["column_nlevels"] = table.columns.nlevels
+    group.attrs["column_names"] = json.dumps(
+        list(table.columns.names), default=_json_default
+    )
+    group.attrs["index_name"] = json.dumps(
+        table.index.name, default=_json_default
+    )
+
+    _write_column(group, "index", *encoded_index)
+    for i, encoded_column in enumerate(encoded_columns):
+        _write_column(group, f"column_{i}", *encoded_column)
+
+
+def read_dataframe(group: h5py.Group) -> pd.DataFrame:
+    """Recover a :class:`DataFrame` that was stored via
+    :func:`write_dataframe`.
+    """
+    columns = [tuple(col) for col in json.loads(group.attrs["columns"])]
+    column_names = json.loads(group.attrs["column_names"])
+    if group.attrs["column_nlevels"] > 1:
+        columns = pd.MultiIndex.from_tuples(columns, names=column_names)
+    else:
+        columns = pd.Index([col[0] for col in columns], name=column_names[0])
+
+    index = pd.Index(
+        _read_column(group["index"]),
+        name=json.loads(group.attrs["index_name"]),
+    )
+
+    # build the table by position, since column labels need not be unique
+    table = pd.DataFrame(
+        {i: _read_column(group[f"column_{i}"]) for i in range(len(columns))},
+        index=index,
+    )
+    table.columns = columns
+    return table
+
 
 def system_from_hdf(
     filename: str,
@@ -276,19 +476,28 @@ def system_from_hdf(
         An instance of :class:`lymph.Unilateral`, :class:`lymph.Bilateral` or
         :class:`lymph.MidlineBilateral`.
     """
-    filename = Path(filename).resolve()
+    filename = Path(filename)
     recover_None = lambda val: val if val != "None" else None
 
-    with h5py.File(filename, 'a') as file:
-        group = file.require_group(f"{name}")
-        classname = group.attrs["class"]
-        graph = jsondict_to_tupledict(json.loads(group.attrs["graph"]))
-        modalities = json.loads(group.attrs["modalities"])
-        base_symmetric = recover_None(group.attrs["base_symmetric"])
-        trans_symmetric = recover_None(group.attrs["trans_symmetric"])
-
-    with pd.HDFStore(filename, 'a') as store:
-        patient_data = store.get(f"{name}/patient_data")
+    with h5py.File(filename, 'r') as file:
+        group = file[name or "/"]
+        attrs = dict(group.attrs)
+        classname = attrs["class"]
+        graph = jsondict_to_tupledict(json.loads(attrs["graph"]))
+        modalities = json.loads(attrs["modalities"])
+        base_symmetric = recover_None(attrs["base_symmetric"])
+        trans_symmetric = recover_None(attrs["trans_symmetric"])
+
+        data_group = group["patient_data"]
+        if data_group.attrs.get("format") == "lymph":
+            patient_data = read_dataframe(data_group)
+        else:
+            patient_data = None
+
+    # files written by earlier versions store the data in pandas' format
+    if patient_data is None:
+        with pd.HDFStore(filename, 'r') as store:
+            patient_data = store.get(f"{name}/patient_data")
 
     if classname == "Unilateral":
         new_cls = lymph.Unilateral
@@ -315,10 +524,22 @@ def system_from_hdf(
 
 def fast_binomial_pmf(k: int, n: int, p: float):
     """Compute the probability mass function of the binomial distribution.
+
+    This is done in log-space, which does not overflow for large ``n``.
+    ``xlogy`` and ``xlog1py`` make sure that e.g. :math:`0 \\cdot \\log 0 = 0`
+    for the edge cases ``p = 0`` and ``p = 1``.
+
+    Since only NumPy ufuncs are involved, ``k``, ``n`` and ``p`` may also be
+    arrays that are broadcast against each other. E.g. ``k`` of shape
+    ``(1, T)`` and ``p`` of shape ``(P, 1)`` yield all ``P`` PMFs over the
+    ``T`` diagnose times at once.
     """
-    q = (1. - p)
-    binom_coeff = fact(n) / (fact(k) * fact(n - k))
-    return binom_coeff * p**k * q**(n - k)
+    log_binom_coeff = gammaln(n + 1) - gammaln(k + 1) - gammaln(n - k + 1)
+    return np.exp(log_binom_coeff + xlogy(k, p) + xlog1py(n - k, -p))
+
+
+# format specifiers of the bases that python can convert integers to natively
+_FORMAT_SPECS = {2: "b", 8: "o", 10: "d", 16: "X"}
 
 
 def change_base(
@@ -347,16 +568,17 @@ def change_base(
         raise ValueError("There is no unary number system, base must be > 2")
 
     convertString = "0123456789ABCDEF"
-    result = ''
 
-    if number == 0:
-        result += '0'
+    if base in _FORMAT_SPECS:
+        # python's C-implemented integer formatting, least significant first
+        result = format(number, _FORMAT_SPECS[base])[::-1]
     else:
+        digits = []
         while number >= base:
-            result += convertString[number % base]
-            number = number//base
-        if number > 0:
-            result += convertString[number]
+            number, remainder = divmod(number, base)
+            digits.append(convertString[remainder])
+        digits.append(convertString[number])
+        result = "".join(digits)
 
     if length is None:
         length = len(result)
@@ -364,12 +586,38 @@ def change_base(
         length = len(result)
         warnings.warn("Length cannot be shorter than converted number.")
 
-    pad = '0' * (length - len(result))
+    result = result.ljust(length, '0')
+    return result if reverse else result[::-1]
+
+
+def find_matching_rows(
+    table: np.ndarray,
+    pattern: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Find the rows of a ``table`` (e.g. the list of all hidden states or all
+    complete observations) that match a potentially incomplete ``pattern``.
+
+    Args:
+        table: 2D array of zeros and ones, one row per state or observation.
+        pattern: One entry for each column of the ``table``. Entries that are
+            ``None`` match anything. If the whole pattern is ``None``, every
+            row of the table matches.
+
+    Returns:
+        A boolean mask that is ``True`` for each matching row.
+    """
+    if pattern is None:
+        return np.ones(shape=len(table), dtype=bool)
+
+    pattern = np.array(pattern)
+    is_given = np.not_equal(pattern, None)
+    given_values = pattern[is_given].astype(float)
+
+    return np.all(table[:,is_given] == given_values, axis=1)
 
-    if reverse:
-        return result + pad
-    else:
-        return pad + result[::-1]
+
+# number of table rows that are binned at once in `comp_state_dist`
+_STATE_DIST_BLOCK_ROWS = 2**16
 
 
 def comp_state_dist(table: np.ndarray) -> Tuple[np.ndarray, List[str]]:
@@ -390,17 +638,27 @@ def comp_state_dist(table: np.ndarray) -> Tuple[np.ndarray, List[str]]:
         if, e.g., one level isn't reported for a patient, that row will just be
         ignored.
     """
+    table = np.asarray(table)
     _, num_cols = table.shape
-    table = table.astype(float)
-    state_dist = np.zeros(shape=2**num_cols, dtype=int)
-    for row in table:
-        if not np.any(np.isnan(row)):
-            idx = int(np.sum([n * 2**i for i,n in enumerate(row[::-1])]))
-            state_dist[idx] += 1
 
-    state_labels = []
-    for i in range(2**num_cols):
-        state_labels.append(change_base(i, 2, length=num_cols))
+    # boolean and integer tables cannot contain missing values
+    if table.dtype.kind not in "bi":
+        table = table.astype(float)
+        table = table[~np.any(np.isnan(table), axis=1)]
+
+    # interpret each complete row as a binary number (first column is the most
+    # significant bit) and count how often each number appears. This is done
+    # in blocks of rows, so that the temporary arrays stay small for long tables
+    shifts = np.arange(num_cols - 1, -1, -1, dtype=np.int64)
+    weights = 1 << shifts
+    state_dist = np.zeros(shape=2**num_cols, dtype=np.int64)
+    for start in range(0, len(table), _STATE_DIST_BLOCK_ROWS):
+        block = table[start:start + _STATE_DIST_BLOCK_ROWS]
+        idx = (block @ weights).astype(np.int64, copy=False)
+        state_dist += np.bincount(idx, minlength=2**num_cols)
+
+    bits = (np.arange(2**num_cols)[:,np.newaxis] >> shifts) & 1
+    state_labels = ["".join(row) for row in bits.astype(str)]
 
     return state_dist, state_labels
 
@@ -434,33 +692,39 @@ def draw_diagnose_times(
     # draw the diagnose times for each patient
     if diag_times is not None:
         t_stages = list(diag_times.keys())
-        drawn_t_stages = np.random.choice(
-            t_stages,
+        stage_idx = np.random.choice(
+            len(t_stages),
             p=stage_dist,
             size=num_patients
         )
-        drawn_diag_times = [diag_times[t] for t in drawn_t_stages]
+        drawn_diag_times = np.array([diag_times[t] for t in t_stages])[stage_idx]
 
     elif time_dists is not None:
         t_stages = list(time_dists.keys())
         max_t = len(time_dists[t_stages[0]]) - 1
         time_steps = np.arange(max_t + 1)
 
-        drawn_t_stages = np.random.choice(
-            t_stages,
+        stage_idx = np.random.choice(
+            len(t_stages),
             p=stage_dist,
             size=num_patients
         )
-        drawn_diag_times = [
-            np.random.choice(time_steps, p=time_dists[t])
-            for t in drawn_t_stages
-        ]
+        # draw the diagnose times of all patients with the same T-stage at once
+        drawn_diag_times = np.empty(shape=(num_patients,), dtype=int)
+        for i, stage in enumerate(t_stages):
+            has_stage = stage_idx == i
+            drawn_diag_times[has_stage] = np.random.choice(
+                time_steps,
+                p=time_dists[stage],
+                size=np.sum(has_stage)
+            )
 
     else:
         raise ValueError(
             "Either `diag_times`or `time_dists` must be provided"
         )
 
+    drawn_t_stages = np.array(t_stages)[stage_idx]
     return drawn_t_stages, drawn_diag_times
 
 
@@ -479,15 +743,12 @@ def draw_from_simplex(ndim: int, nsample: int = 1) -> np.ndarray:
     if nsample < 1:
         raise ValueError("Generating less than one sample doesn't make sense")
 
-    rand = np.random.uniform(size=(nsample, ndim-1))
-    unsorted = np.concatenate(
-        [np.zeros(shape=(nsample,1)), rand, np.ones(shape=(nsample,1))],
-        axis=1
-    )
-    sorted = np.sort(unsorted, axis=1)
-
-    diff_arr = np.concatenate([[-1., 1.], np.zeros(ndim-1)])
-    diff_mat = np.array([np.roll(diff_arr, i) for i in range(ndim)]).T
-    res = sorted @ diff_mat
+    # the gaps between sorted uniform samples in [0,1] are uniformly
+    # distributed on the simplex
+    padded = np.empty(shape=(nsample, ndim+1))
+    padded[:,0] = 0.
+    padded[:,-1] = 1.
+    padded[:,1:-1] = np.random.uniform(size=(nsample, ndim-1))
+    padded.sort(axis=1)
 
-    return res
\ No newline at end of file
+    return np.diff(padded, axis=1)
\ No newline at end of file
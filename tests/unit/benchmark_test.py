@@ -0,0 +1,79 @@
+"""Micro-benchmarks of the computations that dominate sampling. They only run
+when the ``pytest-benchmark`` plugin is installed, e.g. like this:
+
+    pytest tests/unit/benchmark_test.py --benchmark-only --benchmark-autosave
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import lymph
+from lymph.utils import fast_binomial_pmf
+
+pytest.importorskip("pytest_benchmark")
+
+RNG = np.random.default_rng(42)
+
+GRAPH = {('tumor', 'primary'): ['one', 'two'],
+         ('lnl', 'one'):       ['two', 'three'],
+         ('lnl', 'two'):       ['three'],
+         ('lnl', 'three'):     []}
+
+
+@pytest.fixture(scope="module")
+def loaded_bisys():
+    bisys = lymph.Bilateral(graph=GRAPH)
+    bisys.modalities = {'test-o-meter': [0.99, 0.88]}
+    bisys.patient_data = pd.read_csv(
+        "./tests/bilateral_mockup_data.csv", header=[0,1,2]
+    )
+    return bisys
+
+@pytest.fixture(scope="module")
+def time_dists():
+    t = np.arange(11)
+    return {
+        "early": fast_binomial_pmf(t, 10, 0.3),
+        "late":  fast_binomial_pmf(t, 10, 0.7),
+    }
+
+
+def new_spread_probs(bisys):
+    """Setup for ``benchmark.pedantic``: Fresh spread probabilities for every
+    round, so that no cached transition matrix or evolution is reused."""
+    return (RNG.uniform(size=bisys.num_spread_probs),), {}
+
+
+def test_transition_matrix(benchmark, loaded_bisys):
+    def compute_transition_matrix(spread_probs):
+        loaded_bisys.spread_probs = spread_probs
+        return loaded_bisys.ipsi.transition_matrix
+
+    transition_matrix = benchmark.pedantic(
+        compute_transition_matrix,
+        setup=lambda: new_spread_probs(loaded_bisys),
+        rounds=100,
+    )
+    assert np.allclose(transition_matrix.sum(axis=1), 1.)
+
+
+def test_observation_matrix(benchmark, loaded_bisys):
+    def compute_observation_matrix():
+        if hasattr(loaded_bisys.ipsi, "_observation_matrix"):
+            del loaded_bisys.ipsi._observation_matrix
+        return loaded_bisys.ipsi.observation_matrix
+
+    observation_matrix = benchmark(compute_observation_matrix)
+    assert np.allclose(observation_matrix.sum(axis=1), 1.)
+
+
+def test_marginal_log_likelihood(benchmark, loaded_bisys, time_dists):
+    llh = benchmark.pedantic(
+        loaded_bisys.marginal_log_likelihood,
+        setup=lambda: (
+            new_spread_probs(loaded_bisys)[0],
+            {"t_stages": ["early", "late"], "time_dists": time_dists}
+        ),
+        rounds=100,
+    )
+    assert llh < 0.
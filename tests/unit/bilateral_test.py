@@ -1,9 +1,24 @@
+import copy
+from functools import lru_cache
+
 import numpy as np
 import pandas as pd
 import pytest
-import scipy as sp
+from helpers import are_close_to_one
 
 import lymph
+from lymph.utils import fast_binomial_pmf
+
+RNG = np.random.default_rng(42)
+
+
+@lru_cache(maxsize=None)
+def binom_time_dist(max_t: int, p: float) -> np.ndarray:
+    """Binomial distribution over the diagnose times 0, ..., ``max_t``. Since
+    the result is cached and shared, it is read-only."""
+    time_dist = fast_binomial_pmf(np.arange(max_t + 1), max_t, p)
+    time_dist.flags.writeable = False
+    return time_dist
 
 
 @pytest.fixture(scope="session")
@@ -18,60 +33,81 @@ def max_t():
 def diag_times(t_stages, max_t):
     res = {}
     for stage in t_stages:
-        res[stage] = np.random.randint(low=0, high=max_t)
+        res[stage] = RNG.integers(low=0, high=max_t)
     return res
 
 @pytest.fixture(scope="session")
 def time_dists(t_stages, max_t):
     res = {}
     p = 0.5
-    t = np.arange(max_t + 1)
     for stage in t_stages:
-        p = np.random.uniform(low=0., high=p)
-        res[stage] = sp.stats.binom.pmf(t, max_t, p)
+        p = RNG.uniform(low=0., high=p)
+        res[stage] = binom_time_dist(max_t, p)
     return res
 
 @pytest.fixture(scope="session", params=[10])
 def early_time_dist(request):
-    num_time_steps = request.param
-    t = np.arange(num_time_steps + 1)
-    return sp.stats.binom.pmf(t, num_time_steps, 0.3)
+    return binom_time_dist(request.param, 0.3)
 
 @pytest.fixture(scope="session", params=[10])
 def late_time_dist(request):
-    num_time_steps = request.param
-    t = np.arange(num_time_steps + 1)
-    return sp.stats.binom.pmf(t, num_time_steps, 0.7)
+    return binom_time_dist(request.param, 0.7)
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def modality_spsn():
     return {'test-o-meter': [0.99, 0.88]}
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def unidata():
-    return pd.read_csv("./tests/unilateral_mockup_data.csv", header=[0,1])
+    return pd.read_csv(
+        "./tests/unilateral_mockup_data.csv",
+        header=[0,1], engine="c", memory_map=True
+    )
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def bidata():
-    return pd.read_csv("./tests/bilateral_mockup_data.csv", header=[0,1,2])
+    return pd.read_csv(
+        "./tests/bilateral_mockup_data.csv",
+        header=[0,1,2], engine="c", memory_map=True
+    )
+
+@pytest.fixture(scope="session")
+def graph():
+    return {('tumor', 'primary'): ['one', 'two'],
+            ('lnl', 'one'):       ['two', 'three'],
+            ('lnl', 'two'):       ['three'],
+            ('lnl', 'three'):     []}
 
 @pytest.fixture
-def bisys():
-    graph = {('tumor', 'primary'): ['one', 'two'],
-             ('lnl', 'one'):       ['two', 'three'],
-             ('lnl', 'two'):       ['three'],
-             ('lnl', 'three'):     []}
+def bisys(graph):
     return lymph.Bilateral(graph=graph)
 
-@pytest.fixture
-def loaded_bisys(bisys, bidata, t_stages, modality_spsn):
+@pytest.fixture(scope="session")
+def session_loaded_bisys(graph, bidata, modality_spsn):
+    bisys = lymph.Bilateral(graph=graph)
     bisys.modalities = modality_spsn
     bisys.patient_data = bidata
     return bisys
 
 @pytest.fixture
-def spread_probs(bisys):
-    return np.random.uniform(low=0., high=1., size=bisys.spread_probs.shape)
+def loaded_bisys(session_loaded_bisys):
+    # tests change the parameters of the system, so each gets its own copy
+    return copy.deepcopy(session_loaded_bisys)
+
+@pytest.fixture(scope="session")
+def spread_probs_sample(graph):
+    """Spread probabilities for a system without any symmetries, i.e. with the
+    most parameters. Systems with fewer parameters use the first entries."""
+    asym_bisys = lymph.Bilateral(
+        graph=graph, base_symmetric=False, trans_symmetric=False
+    )
+    sample = RNG.uniform(low=0., high=1., size=asym_bisys.num_spread_probs)
+    sample.flags.writeable = False
+    return sample
+
+@pytest.fixture
+def spread_probs(bisys, spread_probs_sample):
+    return spread_probs_sample[:bisys.num_spread_probs].copy()
 
 
 def test_initialization(bisys):
@@ -88,39 +124,47 @@ def test_initialization(bisys):
                           (False, False)])
 def test_spread_probs_and_A_matrices(bisys, base_symmetric, trans_symmetric):
     # size of spread_probs depends on symmetries
-    spread_probs = np.random.uniform(size=((2 - base_symmetric) * 2
-                                    + (2 - trans_symmetric) * 3))
+    spread_probs = RNG.uniform(size=((2 - base_symmetric) * 2
+                                      + (2 - trans_symmetric) * 3))
 
     bisys.base_symmetric = base_symmetric
     bisys.trans_symmetric = trans_symmetric
     bisys.spread_probs = spread_probs
 
     # input should match read-out
-    assert np.all(np.equal(spread_probs, bisys.spread_probs))
-
-    # check A matrices
-    assert hasattr(bisys.ipsi, 'transition_matrix')
-    for t in range(10):
-        row_sums = np.sum(
-            np.linalg.matrix_power(bisys.ipsi.transition_matrix, t),
-            axis=1
-        )
-        assert np.all(np.isclose(row_sums, 1.))
-
-    assert hasattr(bisys.contra, 'transition_matrix')
-    for t in range(10):
-        row_sums = np.sum(
-            np.linalg.matrix_power(bisys.contra.transition_matrix, t),
-            axis=1
-        )
-        assert np.all(np.isclose(row_sums, 1.))
+    assert np.array_equal(spread_probs, bisys.spread_probs)
+    assert bisys.num_spread_probs == len(spread_probs)
+
+    # setting parameters alone must not compute any transition matrix. They
+    # are only shared right before they are used
+    assert not hasattr(bisys.ipsi, '_transition_matrix')
+    assert not hasattr(bisys.contra, '_transition_matrix')
+    bisys._share_transition_matrix()
+
+    # check A matrices: the row sums of A^t are A^t @ 1, so they can be
+    # computed with one matrix-vector product per power, which is written
+    # alternately into two preallocated buffers
+    num_states = 2**len(bisys.ipsi.lnls)
+    row_sums, next_row_sums = np.empty(num_states), np.empty(num_states)
+    for side in [bisys.ipsi, bisys.contra]:
+        assert hasattr(side, 'transition_matrix')
+        # A^0 is the identity, so start with the row sums of A^1
+        row_sums[:] = 1.
+        for _ in range(1, 10):
+            np.matmul(side.transition_matrix, row_sums, out=next_row_sums)
+            row_sums, next_row_sums = next_row_sums, row_sums
+            assert are_close_to_one(row_sums)
 
     if base_symmetric and trans_symmetric:
-        assert np.all(np.equal(bisys.ipsi.transition_matrix,
-                               bisys.contra.transition_matrix))
+        assert bisys.ipsi.transition_matrix is bisys.contra.transition_matrix
     else:
-        assert ~np.all(np.equal(bisys.ipsi.transition_matrix,
-                                bisys.contra.transition_matrix))
+        assert not np.array_equal(bisys.ipsi.transition_matrix,
+                                  bisys.contra.transition_matrix)
+
+    # setting the same parameters again should not trigger a recomputation
+    ipsi_transition_matrix = bisys.ipsi.transition_matrix
+    bisys.spread_probs = spread_probs
+    assert bisys.ipsi.transition_matrix is ipsi_transition_matrix
 
 
 def test_observation_matrix(bisys, modality_spsn):
@@ -129,12 +173,17 @@ def test_observation_matrix(bisys, modality_spsn):
     assert hasattr(bisys.contra, 'observation_matrix')
 
     row_sums = np.sum(bisys.ipsi.observation_matrix, axis=1)
-    assert np.all(np.isclose(row_sums, 1.))
+    assert are_close_to_one(row_sums)
 
-    assert np.all(
-        np.equal(bisys.ipsi.observation_matrix, bisys.contra.observation_matrix)
+    assert np.array_equal(
+        bisys.ipsi.observation_matrix, bisys.contra.observation_matrix
     )
 
+    # the contralateral side may reuse the ipsilateral observation matrix
+    del bisys.contra._observation_matrix
+    bisys._share_observation_matrix()
+    assert bisys.contra.observation_matrix is bisys.ipsi.observation_matrix
+
 
 def test_load_data(bisys, bidata, t_stages, modality_spsn):
     bisys.modalities = modality_spsn
@@ -179,7 +228,7 @@ def test_log_likelihood(
         time_dists = None
         shifted_diag_times = {}
         for stage in t_stages:
-            small_shift = np.random.uniform(-0.2, 0.2)
+            small_shift = RNG.uniform(-0.2, 0.2)
             shifted_diag_times[stage] = diag_times[stage] + small_shift
 
     llh = loaded_bisys.log_likelihood(
@@ -202,64 +251,61 @@ def test_log_likelihood(
     "base_symmetric, trans_symmetric",
     [(True, True), (True, False), (False, True), (False, False)]
 )
+@pytest.mark.parametrize("spread_shift, expect_inf", [(0., False), (1., True)])
 def test_marginal_log_likelihood(
-    loaded_bisys,
+    loaded_bisys, spread_probs_sample,
     t_stages, early_time_dist, late_time_dist,
-    base_symmetric, trans_symmetric
+    base_symmetric, trans_symmetric,
+    spread_shift, expect_inf
 ):
     """
     Test the log-likelihood that marginalizes over diagnose times when provided
-    with a distribution over these diagnose times.
+    with a distribution over these diagnose times. Out of bounds spread
+    probabilities must yield -inf likelihood.
     """
     loaded_bisys.base_symmetric=base_symmetric
     loaded_bisys.trans_symmetric=trans_symmetric
 
-    # check sensible log-likelihood
-    spread_probs = np.random.uniform(size=loaded_bisys.spread_probs.shape)
+    spread_probs = spread_probs_sample[:loaded_bisys.num_spread_probs]
     llh = loaded_bisys.marginal_log_likelihood(
-        spread_probs, t_stages=t_stages,
+        spread_probs + spread_shift, t_stages=t_stages,
         time_dists={"early": early_time_dist,
                     "late" : late_time_dist}
     )
-    assert llh < 0.
-
-    # check that out of bounds spread probabilities yield -inf likelihood
-    spread_probs = np.random.uniform(size=loaded_bisys.spread_probs.shape) + 1.
-    llh = loaded_bisys.marginal_log_likelihood(
-        spread_probs, t_stages=t_stages,
-        time_dists={"early": early_time_dist,
-                    "late" : late_time_dist})
-    assert np.isinf(llh)
+    if expect_inf:
+        assert np.isinf(llh)
+    else:
+        assert llh < 0.
 
 
-def test_time_log_likelihood(loaded_bisys, t_stages):
+def test_time_log_likelihood(loaded_bisys, spread_probs_sample, t_stages):
     """
     Check the log-likelihood that's an explicit function of the diagnose time.
     """
-    spread_probs = np.random.uniform(size=loaded_bisys.spread_probs.shape)
-    times = np.array([0.7, 3.8])
-    theta = np.concatenate([spread_probs, times])
+    # the spread probabilities stay the same, only the times are changed
+    spread_probs = spread_probs_sample[:loaded_bisys.num_spread_probs]
+    theta = np.empty(shape=len(spread_probs) + 2)
+    theta[:-2] = spread_probs
+
+    theta[-2:] = (0.7, 3.8)
     llh_1 = loaded_bisys.time_log_likelihood(
         theta, t_stages=t_stages, max_t=10
     )
     assert llh_1 < 0.
 
-    times = np.array([0.8, 3.85])
-    theta = np.concatenate([spread_probs, times])
+    theta[-2:] = (0.8, 3.85)
     llh_2 = loaded_bisys.time_log_likelihood(
         theta, t_stages=t_stages, max_t=10
     )
     assert np.isclose(llh_1, llh_2)
 
-    times = np.array([0.8, 3.4])
-    theta = np.concatenate([spread_probs, times])
+    theta[-2:] = (0.8, 3.4)
     llh_3 = loaded_bisys.time_log_likelihood(
         theta, t_stages=t_stages, max_t=10
     )
     assert ~np.isclose(llh_1, llh_3)
 
-    times = np.array([0.8, 10.6])
-    theta = np.concatenate([spread_probs, times])
+    theta[-2:] = (0.8, 10.6)
     llh_4 = loaded_bisys.time_log_likelihood(
         theta, t_stages=t_stages, max_t=10
     )
@@ -270,121 +316,139 @@ def test_time_log_likelihood(loaded_bisys, t_stages):
     "base_symmetric, trans_symmetric",
     [(True, True), (True, False), (False, True), (False, False)]
 )
+@pytest.mark.parametrize(
+    "spread_shift, p_shift, expect_inf",
+    [(0., 0., False), (1., 0., True), (0., 1., True)]
+)
 def test_binom_marg_log_likelihood(
-    loaded_bisys, t_stages,
-    base_symmetric, trans_symmetric
+    loaded_bisys, spread_probs_sample, t_stages,
+    base_symmetric, trans_symmetric,
+    spread_shift, p_shift, expect_inf
 ):
     """
     Check the loh-likelihood marginalizeing over diagnose times using
-    binomial distributions.
+    binomial distributions. Out of bounds spread probabilities or binomial
+    parameters must yield -inf likelihood.
     """
     loaded_bisys.base_symmetric=base_symmetric
     loaded_bisys.trans_symmetric=trans_symmetric
 
-    spread_probs = np.random.uniform(size=(len(loaded_bisys.spread_probs)))
-    p = np.random.uniform(low=0., high=1., size=len(t_stages))
-    theta = np.concatenate([spread_probs, p])
-    llh = loaded_bisys.binom_marg_log_likelihood(
-        theta, t_stages,
-        max_t=10
-    )
-    assert llh < 0.
-
-    spread_probs = np.random.uniform(size=(len(loaded_bisys.spread_probs))) + 1.
-    p = np.random.uniform(low=0., high=1., size=len(t_stages))
-    theta = np.concatenate([spread_probs, p])
+    # fill the parameter vector in place: spread probs first, then binomial p's
+    num_spread_probs = loaded_bisys.num_spread_probs
+    theta = np.empty(shape=num_spread_probs + len(t_stages))
+    np.add(spread_probs_sample[:num_spread_probs], spread_shift,
+           out=theta[:num_spread_probs])
+    theta[num_spread_probs:] = RNG.uniform(low=0., high=1., size=len(t_stages))
+    theta[num_spread_probs:] += p_shift
     llh = loaded_bisys.binom_marg_log_likelihood(
         theta, t_stages,
         max_t=10
     )
-    assert np.isinf(llh)
-
-    spread_probs = np.random.uniform(size=(len(loaded_bisys.spread_probs)))
-    p = np.random.uniform(low=0., high=1., size=len(t_stages)) + 1.
-    theta = np.concatenate([spread_probs, p])
-    llh = loaded_bisys.binom_marg_log_likelihood(
-        theta, t_stages,
-        max_t=10
-    )
-    assert np.isinf(llh)
+    if expect_inf:
+        assert np.isinf(llh)
+    else:
+        assert llh < 0.
 
 
-@pytest.mark.parametrize("inv_ipsi, inv_contra, diag_ipsi, diag_contra", [
+RISK_CASES = [
+    # inv_ipsi,             inv_contra,            diag_ipsi,             diag_contra
     ([True,  False, None],  [None, None,  None],  [False, None,  None],  [None,  None, None]),
     ([False, False, False], [None, True,  True],  [True,  None,  None],  [False, True, None]),
     ([None,  True,  False], [True, True,  True],  [True,  False, False], [None,  True, None]),
     ([False, False, None],  [None, False, False], [False, False, False], [None,  False, None])
-])
-def test_risk(
-    loaded_bisys, t_stages, time_dists,
-    inv_ipsi, inv_contra,
-    diag_ipsi, diag_contra
-):
+]
+
+def test_risk(loaded_bisys, spread_probs_sample, t_stages, time_dists):
     """
-    Test te risk computation.
+    Test te risk computation. All cases share the same system and spread
+    probabilities.
     """
-    # select random spread_probs
-    spread_probs = np.random.uniform(size=loaded_bisys.spread_probs.shape)
+    spread_probs = spread_probs_sample[:loaded_bisys.num_spread_probs]
 
     # use some time-prior
     time_dist = time_dists[t_stages[0]]
 
-    # put together requested involvement & diagnoses in the correct format
-    inv = {"ipsi": inv_ipsi, "contra": inv_contra}
-    diagnoses = {"ipsi":   {"test-o-meter": diag_ipsi},
-                 "contra": {"test-o-meter": diag_contra}}
-    risk = loaded_bisys.risk(
-        spread_probs=spread_probs,
-        inv=inv,
-        diagnoses=diagnoses,
-        time_dist=time_dist,
-        mode="HMM"
-    )
-    assert risk >= 0.
-    assert risk <= 1.
-
-    # the bi- & unilateral risk prediction must be the same, when we ignore one
-    # side in the bilateral case. This means that we provide only ``None`` for
-    # the involvement array of interest for the ignored side and also tell it
-    # that this side's diagnose is missing.
-    inv = {"ipsi": inv_ipsi, "contra": [None, None, None]}
-    diagnoses = {"ipsi":   {"test-o-meter": diag_ipsi},
-                 "contra": {"test-o-meter": [None, None, None]}}
-    birisk_ignore_contra = loaded_bisys.risk(
-        spread_probs=spread_probs,
-        inv=inv,
-        diagnoses=diagnoses,
-        time_dist=time_dist,
-        mode="HMM"
-    )
+    inv_batch, diagnoses_batch, risks = [], [], []
+    for i, (inv_ipsi, inv_contra, diag_ipsi, diag_contra) in enumerate(RISK_CASES):
+        # put together requested involvement & diagnoses in the correct format
+        inv = {"ipsi": inv_ipsi, "contra": inv_contra}
+        diagnoses = {"ipsi":   {"test-o-meter": diag_ipsi},
+                     "contra": {"test-o-meter": diag_contra}}
+        risk = loaded_bisys.risk(
+            spread_probs=spread_probs,
+            inv=inv,
+            diagnoses=diagnoses,
+            time_dist=time_dist,
+            mode="HMM"
+        )
+        assert 0. <= risk <= 1., f"risk out of bounds for case {i}"
+        inv_batch.append(inv)
+        diagnoses_batch.append(diagnoses)
+        risks.append(risk)
+
+        # the bi- & unilateral risk prediction must be the same, when we ignore
+        # one side in the bilateral case. This means that we provide only
+        # ``None`` for the involvement array of interest for the ignored side
+        # and also tell it that this side's diagnose is missing.
+        inv = {"ipsi": inv_ipsi, "contra": [None, None, None]}
+        diagnoses = {"ipsi":   {"test-o-meter": diag_ipsi},
+                     "contra": {"test-o-meter": [None, None, None]}}
+        birisk_ignore_contra = loaded_bisys.risk(
+            spread_probs=spread_probs,
+            inv=inv,
+            diagnoses=diagnoses,
+            time_dist=time_dist,
+            mode="HMM"
+        )
 
-    inv = {"ipsi": [None, None, None], "contra": inv_contra}
-    diagnoses = {"ipsi":   {"test-o-meter": [None, None, None]},
-                 "contra": {"test-o-meter": diag_contra}}
-    birisk_ignore_ipsi = loaded_bisys.risk(
-        spread_probs=spread_probs,
-        inv=inv,
-        diagnoses=diagnoses,
-        time_dist=time_dist,
-        mode="HMM"
-    )
+        inv = {"ipsi": [None, None, None], "contra": inv_contra}
+        diagnoses = {"ipsi":   {"test-o-meter": [None, None, None]},
+                     "contra": {"test-o-meter": diag_contra}}
+        birisk_ignore_ipsi = loaded_bisys.risk(
+            spread_probs=spread_probs,
+            inv=inv,
+            diagnoses=diagnoses,
+            time_dist=time_dist,
+            mode="HMM"
+        )
 
-    ipsi_risk = loaded_bisys.ipsi.risk(
-        inv=inv_ipsi,
-        diagnoses={"test-o-meter": diag_ipsi},
-        time_dist=time_dist,
-        mode="HMM"
-    )
+        ipsi_risk = loaded_bisys.ipsi.risk(
+            inv=inv_ipsi,
+            diagnoses={"test-o-meter": diag_ipsi},
+            time_dist=time_dist,
+            mode="HMM"
+        )
+
+        contra_risk = loaded_bisys.contra.risk(
+            inv=inv_contra,
+            diagnoses={"test-o-meter": diag_contra},
+            time_dist=time_dist,
+            mode="HMM"
+        )
 
-    contra_risk = loaded_bisys.contra.risk(
-        inv=inv_contra,
-        diagnoses={"test-o-meter": diag_contra},
+        assert np.isclose(birisk_ignore_contra, ipsi_risk), (
+            f"ignoring contra side must yield ipsilateral risk for case {i}"
+        )
+        assert np.isclose(birisk_ignore_ipsi, contra_risk), (
+            f"ignoring ipsi side must yield contralateral risk for case {i}"
+        )
+
+    # computing all cases in one batch must give the same risks
+    batch_risks = loaded_bisys.risk_batch(
+        spread_probs=spread_probs,
+        inv_batch=inv_batch,
+        diagnoses_batch=diagnoses_batch,
         time_dist=time_dist,
         mode="HMM"
     )
+    assert batch_risks.shape == (len(RISK_CASES),)
+    assert np.allclose(batch_risks, risks)
 
-    assert np.isclose(birisk_ignore_contra, ipsi_risk)
-    assert np.isclose(birisk_ignore_ipsi, contra_risk)
+    with pytest.raises(ValueError):
+        loaded_bisys.risk_batch(
+            inv_batch=inv_batch, diagnoses_batch=diagnoses_batch[:-1],
+            time_dist=time_dist
+        )
 
     # Finally, let's make sure that the ipsilateral risk increases when we
     # observe more severe contralateral involvement
@@ -410,4 +474,4 @@ def test_risk(
         mode="HMM"
     )
 
-    assert low_risk < high_risk
\ No newline at end of file
+    assert low_risk < high_risk
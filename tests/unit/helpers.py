@@ -9,4 +9,9 @@ def are_probabilities(test_array: np.ndarray) -> bool:
     are_le_1 = np.all(
         np.less_equal(test_array, 1.)
     )
-    return are_ge_0 and are_le_1
\ No newline at end of file
+    return are_ge_0 and are_le_1
+
+
+def are_close_to_one(test_array: np.ndarray) -> bool:
+    """Check that all entries are close to 1"""
+    return np.allclose(test_array, 1.)
@@ -4,67 +4,64 @@ import pytest
 
 import lymph
 
+RNG = np.random.default_rng(42)
 
-@pytest.fixture
+GRAPH = {('tumor', 'primary'): ['one', 'two'],
+         ('lnl', 'one'):       ['two', 'three'],
+         ('lnl', 'two'):       ['three'],
+         ('lnl', 'three'):     []}
+
+@pytest.fixture(scope="session")
 def data():
     path_dict = {
         "bilateral": "./tests/bilateral_mockup_data.csv",
         "midext": "./tests/midline_ext_mockup_data.csv"
     }
-    return {name: pd.read_csv(path, header=[0,1,2]) for name, path in path_dict.items()}
+    return {
+        name: pd.read_csv(path, header=[0,1,2], engine="c", memory_map=True)
+        for name, path in path_dict.items()
+    }
 
 @pytest.fixture(scope="session")
 def t_stages():
     return ["early", "late"]
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def modality_spsn():
     return {'test-o-meter': [0.99, 0.88]}
 
 @pytest.fixture
 def bisys():
-    graph = {('tumor', 'primary'): ['one', 'two'],
-             ('lnl', 'one'):       ['two', 'three'],
-             ('lnl', 'two'):       ['three'],
-             ('lnl', 'three'):     []}
-    return lymph.Bilateral(graph=graph)
+    return lymph.Bilateral(graph=GRAPH)
 
 @pytest.fixture
 def midbi():
-    graph = {('tumor', 'primary'): ['one', 'two'],
-             ('lnl', 'one'):       ['two', 'three'],
-             ('lnl', 'two'):       ['three'],
-             ('lnl', 'three'):     []}
-    return lymph.MidlineBilateral(graph=graph)
+    return lymph.MidlineBilateral(graph=GRAPH)
 
 @pytest.fixture
 def loaded_midbi(data, t_stages, modality_spsn):
-    graph = {('tumor', 'primary'): ['one', 'two'],
-             ('lnl', 'one'):       ['two', 'three'],
-             ('lnl', 'two'):       ['three'],
-             ('lnl', 'three'):     []}
-    midbi = lymph.MidlineBilateral(graph=graph)
+    midbi = lymph.MidlineBilateral(graph=GRAPH)
     midbi.modalities = modality_spsn
     midbi.patient_data = data["midext"]
     return midbi
 
 @pytest.fixture
 def new_spread_probs(midbi):
-    return np.random.uniform(size=midbi.spread_probs.shape)
+    return RNG.uniform(size=midbi.spread_probs.shape)
 
 
 def test_spread_probs(midbi, new_spread_probs):
     midbi.spread_probs = new_spread_probs
 
-    assert np.all(np.equal(new_spread_probs, midbi.spread_probs)), (
+    assert np.array_equal(new_spread_probs, midbi.spread_probs), (
         "Spread probabilities haven't been set correctly."
     )
-    assert np.all(np.equal(midbi.noext.ipsi.base_probs,
-                           midbi.ext.ipsi.base_probs)), (
+    assert np.array_equal(midbi.noext.ipsi.base_probs,
+                          midbi.ext.ipsi.base_probs), (
         "Ipsilateral base probabilities not the same."
     )
-    assert np.all(np.equal(midbi.noext.trans_probs,
-                           midbi.ext.trans_probs)), (
+    assert np.array_equal(midbi.noext.trans_probs,
+                          midbi.ext.trans_probs), (
         "Transition probabilities not the same."
     )
 
@@ -72,8 +69,8 @@ def test_spread_probs(midbi, new_spread_probs):
         midbi.alpha_mix * midbi.noext.ipsi.base_probs
         + (1 - midbi.alpha_mix) * midbi.noext.contra.base_probs
     )
-    assert np.all(np.isclose(computed_ext_base_contra,
-                             midbi.ext.contra.base_probs)), (
+    assert np.allclose(computed_ext_base_contra,
+                       midbi.ext.contra.base_probs), (
         "Contralateral base probabilities for midline extension are wrong."
     )
 
@@ -12,12 +12,13 @@ from custom_strategies import (
     stage_dist_and_time_dists,
     time_dist_st,
 )
-from helpers import are_probabilities
+from helpers import are_close_to_one, are_probabilities
 from hypothesis import HealthCheck, assume, given, settings
 from hypothesis.extra import numpy as hynp
 from hypothesis.strategies import (
     booleans,
     characters,
+    data,
     floats,
     integers,
     lists,
@@ -93,8 +94,8 @@ def test_constructor(graph):
             )
 
 
-@given(graph=graphs(unique=True))
-def test_string(graph):
+@given(graph=graphs(unique=True), data=data())
+def test_string(graph, data):
     """Test the string representation of the class."""
     model = Unilateral(graph)
     string = str(model)
@@ -104,7 +105,11 @@ def test_string(graph):
             "Edge not in string representation"
         )
 
-    model.spread_probs = np.random.uniform(size=model.spread_probs.shape)
+    model.spread_probs = data.draw(hynp.arrays(
+        dtype=float,
+        shape=model.spread_probs.shape,
+        elements=floats(0., 1.),
+    ))
     string = str(model)
 
     for spread_prob in model.spread_probs:
@@ -156,7 +161,7 @@ def test_graph(graph):
         assert key in recovered_graph, (
             "Recovered graph is missing a key"
         )
-        assert np.all(np.sort(val) == np.sort(recovered_graph[key])), (
+        assert np.array_equal(np.sort(val), np.sort(recovered_graph[key])), (
             "Recovered graph has wrong connection list"
         )
 
@@ -176,7 +181,7 @@ def test_state(model, newstate):
     assert np.all([s == 0 or s == 1 for s in model.state]), (
         "State is not in {0,1}"
     )
-    assert np.all(model.state == newstate[:num_lnls]), (
+    assert np.array_equal(model.state, newstate[:num_lnls]), (
         "State has not been set correctly"
     )
 
@@ -198,7 +203,7 @@ def test_base_probs(model, base_probs):
             "Before assigning new base probs, model has no transition matrix"
         )
         model.base_probs = base_probs
-        assert np.all(model.base_probs == base_probs), (
+        assert np.array_equal(model.base_probs, base_probs), (
             "Base probs have not been assigned correctly"
         )
         assert not hasattr(model, "_transition_matrix"), (
@@ -225,7 +230,7 @@ def test_trans_probs(model, trans_probs):
             "Before assigning new trans probs, model has no transition matrix"
         )
         model.trans_probs = trans_probs
-        assert np.all(model.trans_probs == trans_probs), (
+        assert np.array_equal(model.trans_probs, trans_probs), (
             "Base probs have not been assigned correctly"
         )
         assert not hasattr(model, "_transition_matrix"), (
@@ -252,13 +257,17 @@ def test_spread_probs(model, spread_probs):
             "Before assigning new trans probs, model has no transition matrix"
         )
         model.spread_probs = spread_probs
-        assert np.all(model.spread_probs == spread_probs), (
+        assert np.array_equal(model.spread_probs, spread_probs), (
             "Base probs have not been assigned correctly"
         )
         base_and_trans = np.concatenate([model.base_probs, model.trans_probs])
-        assert np.all(base_and_trans == spread_probs), (
+        assert np.array_equal(base_and_trans, spread_probs), (
             "Concatenation of base and trans probs must give spread probs"
         )
+        edge_probs = [edge.t for edge in model.base_edges + model.trans_edges]
+        assert np.array_equal(edge_probs, spread_probs), (
+            "Edges do not read the spread probs that were set"
+        )
         assert not hasattr(model, "_transition_matrix"), (
             "Outdated transition matrix has not been deleted"
         )
@@ -293,7 +302,7 @@ def test_comp_transition_prob(model, newstate, acquire):
             f"Probability for transitions involving self-healing must be 0"
         )
     if acquire:
-        assert np.all(model.state == newstate), (
+        assert np.array_equal(model.state, newstate), (
             "Model did not acquire the new state"
         )
     if len(model.state) < 8:
@@ -356,6 +365,12 @@ def test_state_list(model):
     assert len(np.unique(state_list, axis=0)) == len(state_list), (
         "Cannot have duplicates in state list"
     )
+    assert state_list.dtype == np.int8 and state_list.flags.c_contiguous, (
+        "State list should be a compact, C-contiguous array"
+    )
+    assert np.all(np.diff(state_list @ 2**np.arange(len(model.lnls))[::-1]) == 1), (
+        "States must be ordered like the binary numbers they represent"
+    )
 
 @given(model=models(), modalities=modalities(valid=True))
 @settings(suppress_health_check=[HealthCheck.data_too_large])
@@ -418,7 +433,7 @@ def test_transition_matrix(model):
     del model._transition_matrix
     transition_matrix = model.transition_matrix
 
-    assert np.all(A == transition_matrix), (
+    assert np.array_equal(A, transition_matrix), (
         "`A` and transition matrix must be the same"
     )
 
@@ -426,7 +441,7 @@ def test_transition_matrix(model):
     assert transition_matrix.shape == (num_states, num_states), (
         "Transition matrix has wrong shape"
     )
-    assert np.all(np.isclose(np.sum(transition_matrix, axis=1), 1.)), (
+    assert are_close_to_one(np.sum(transition_matrix, axis=1)), (
         "Transition matrix must be stochastic matrix (rows sum to 1)"
     )
 
@@ -467,7 +482,7 @@ def test_modalities(model, modalities):
         assert spsn[1] == model._spsn_tables[mod][1,1], (
             "Wrong sensitivity"
         )
-        assert np.all(np.isclose(np.sum(model._spsn_tables[mod], axis=0), 1.)), (
+        assert are_close_to_one(np.sum(model._spsn_tables[mod], axis=0)), (
             "spsn table must sum to one along columns"
         )
 
@@ -496,14 +511,14 @@ def test_observation_matrix(model, modalities):
     assert observation_matrix.shape == (2**num_lnls, 2**(num_lnls * num_mod)), (
         "Observation matrix has wrong shape"
     )
-    assert np.all(np.isclose(np.sum(observation_matrix, axis=1), 1.)), (
+    assert are_close_to_one(np.sum(observation_matrix, axis=1)), (
         "Observation matrix must be stochastic matrix (rows sum to 1)"
     )
 
     model.modalities = {"simple": [1., 1.]}
     observation_matrix = model.observation_matrix
 
-    assert np.all(observation_matrix == np.eye(2**num_lnls)), (
+    assert np.array_equal(observation_matrix, np.eye(2**num_lnls)), (
         "For sensitivity & specificity of 100%, observation matrix of only one "
         "modality must be the unit matrix"
     )
@@ -626,9 +641,17 @@ def test_evolve(model, spread_probs, t_first, t_last):
         assert state_probs.shape[1] == 2**len(model.lnls), (
             "Returned state probs have wrong shape"
         )
-        assert np.all(np.isclose(np.sum(state_probs, axis=1), 1.)), (
+        assert are_close_to_one(np.sum(state_probs, axis=1)), (
             "Sum over probabilities for all states must be 1"
         )
+        assert model._evolve(t_first, t_last) is state_probs, (
+            "Evolution with unchanged spread probs should come from the cache"
+        )
+
+        model.spread_probs = np.zeros_like(model.spread_probs)
+        assert np.all(model._evolve(t_first, t_last)[:,0] == 1.), (
+            "Cached evolution must not be reused after changing spread probs"
+        )
 
 
 @given(
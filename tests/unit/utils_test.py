@@ -1,3 +1,4 @@
+import h5py
 import hypothesis.extra.numpy as npst
 import numpy as np
 import pandas as pd
@@ -6,10 +7,14 @@ import scipy as sp
 from custom_strategies import t_stages_st
 from hypothesis import assume, example, given, settings
 from hypothesis.strategies import (
+    booleans,
     characters,
+    data,
     dictionaries,
     floats,
     integers,
+    lists,
+    none,
     one_of,
     text,
     tuples,
@@ -22,9 +27,13 @@ from lymph.utils import (
     draw_diagnose_times,
     draw_from_simplex,
     fast_binomial_pmf,
+    find_matching_rows,
     jsondict_to_tupledict,
+    lyprox_to_lymph,
+    read_dataframe,
     system_from_hdf,
     tupledict_to_jsondict,
+    write_dataframe,
 )
 
 
@@ -76,6 +85,40 @@ def test_json_tupledict_interface(tuple_dict):
         )
 
 
+def test_lyprox_to_lymph():
+    columns = pd.MultiIndex.from_tuples([
+        ("tumor", "1", "t_stage"),
+        ("tumor", "1", "extension"),
+        ("MRI", "ipsi", "date"),
+        ("MRI", "ipsi", "II"),
+        ("MRI", "contra", "II"),
+    ])
+    lyprox_data = pd.DataFrame(
+        [[1, False, "2021-03-01", True, False],
+         [4, True, "2022-11-30", False, None]],
+        columns=columns,
+    )
+    convert_t_stage = {0: "early", 1: "early", 2: "early", 3: "late", 4: "late"}
+
+    converted = lyprox_to_lymph(
+        lyprox_data, modalities=["MRI"], convert_t_stage=convert_t_stage
+    )
+    assert converted[("info", "t_stage")].tolist() == ["early", "late"], (
+        "T-stages were not correctly converted"
+    )
+
+    with pytest.raises(KeyError):
+        lyprox_to_lymph(
+            lyprox_data, modalities=["MRI"], convert_t_stage={1: "early"}
+        )
+
+    lyprox_data.loc[1, ("tumor", "1", "t_stage")] = np.nan
+    with pytest.raises(KeyError):
+        lyprox_to_lymph(
+            lyprox_data, modalities=["MRI"], convert_t_stage=convert_t_stage
+        )
+
+
 def test_hdf_io(unilateral_model, tmp_path):
     graph = unilateral_model.graph
     modalities = unilateral_model.modalities
@@ -106,6 +149,55 @@ def test_hdf_io(unilateral_model, tmp_path):
     )
 
 
+def test_dataframe_hdf_roundtrip(tmp_path):
+    table = pd.DataFrame({
+        ("MRI", "II"): np.array([np.True_, np.False_, None], dtype=object),
+        ("MRI", "III"): [True, None, np.nan],
+        ("info", "t_stage"): ["early", "late", "early"],
+        ("info", "age"): [61, 72, 58],
+        ("info", "diagnosed"): pd.to_datetime(["2021-03-01", None, "2022-11-30"]),
+    })
+
+    with h5py.File(tmp_path / "table.h5", "w") as file:
+        write_dataframe(file.create_group("table"), table)
+    with h5py.File(tmp_path / "table.h5", "r") as file:
+        recovered = read_dataframe(file["table"])
+
+    assert recovered.equals(table), (
+        "Table was not correctly recovered"
+    )
+    assert recovered.dtypes.equals(table.dtypes), (
+        "Column dtypes were not correctly recovered"
+    )
+
+    table.columns.names = ["modality", "lnl"]
+    table.index.name = "patient"
+    table = pd.concat([table, table[[("info", "age")]] + 1], axis=1)
+    with h5py.File(tmp_path / "table.h5", "w") as file:
+        write_dataframe(file.create_group("table"), table)
+    with h5py.File(tmp_path / "table.h5", "r") as file:
+        recovered = read_dataframe(file["table"])
+
+    assert recovered.equals(table), (
+        "Table with duplicate column labels was not correctly recovered"
+    )
+    assert recovered.columns.names == table.columns.names, (
+        "Names of the column levels were not recovered"
+    )
+    assert recovered.index.name == table.index.name, (
+        "Name of the index was not recovered"
+    )
+
+    table[("info", "grade")] = pd.Categorical(["a", "b", "a"])
+    with h5py.File(tmp_path / "table.h5", "w") as file:
+        group = file.create_group("table")
+        with pytest.raises(TypeError):
+            write_dataframe(group, table)
+        assert len(group) == 0 and len(group.attrs) == 0, (
+            "Nothing must be written when the table cannot be stored"
+        )
+
+
 @given(
     k=integers(0, 170),
     n=integers(0, 170),
@@ -119,6 +211,25 @@ def test_fast_binomial_pmf(k, n, p):
     )
 
 
+@given(
+    n=integers(0, 100),
+    p=npst.arrays(dtype=float, shape=integers(1, 10), elements=floats(0.01, 0.99)),
+)
+def test_fast_binomial_pmf_broadcasting(n, p):
+    k = np.arange(n + 1)
+    pmfs = fast_binomial_pmf(k[np.newaxis,:], n, p[:,np.newaxis])
+
+    assert pmfs.shape == (len(p), n + 1), (
+        "PMFs were not broadcast to one row per probability"
+    )
+    assert np.allclose(pmfs, sp.stats.binom.pmf(k[np.newaxis,:], n, p[:,np.newaxis])), (
+        "Broadcast binomial PMFs are wrong"
+    )
+    assert np.allclose(pmfs.sum(axis=1), 1.), (
+        "Each PMF must sum to one over its support"
+    )
+
+
 @given(
     number=integers(-1),
     base=integers(-1, 17),
@@ -176,27 +287,60 @@ def test_comp_state_dist(table):
         "There must be as many labels as 'bin' ins the histogram"
     )
 
+    # compare rows bit-packed into bytes, i.e. up to eight LNLs at once
+    packed_table = np.packbits(table, axis=1)
     for count,label in zip(state_dist, state_labels):
         state = np.array([bool(int(digit)) for digit in label])
-        recount = np.sum(np.all(state == table, axis=1))
+        recount = np.sum(np.all(np.packbits(state) == packed_table, axis=1))
         assert count == recount, (
             f"Counts don't match up for state {state} and count {count}"
         )
 
 
+@given(
+    table=integers(1, 4).flatmap(
+        lambda n: npst.arrays(dtype=bool, shape=(20, n))
+    ),
+    data=data(),
+)
+def test_find_matching_rows(table, data):
+    num_cols = table.shape[1]
+    pattern = data.draw(
+        lists(one_of(booleans(), none()), min_size=num_cols, max_size=num_cols)
+    )
+
+    matching = find_matching_rows(table, pattern)
+    assert matching.shape == (len(table),), (
+        "Mask must have one entry per row of the table"
+    )
+
+    for row, is_match in zip(table, matching):
+        expected = all(p is None or p == r for p, r in zip(pattern, row))
+        assert is_match == expected, (
+            f"Row {row} incorrectly (not) matched to pattern {pattern}"
+        )
+
+    assert np.all(find_matching_rows(table, None)), (
+        "Every row must match when no pattern is given"
+    )
+
+
 @given(
     num_patients=integers(-1, 1000),
     t_stages=t_stages_st(),
-    max_t=integers(1,100)
+    max_t=integers(1,100),
+    data=data(),
 )
 def test_draw_diagnose_times(
-    num_patients, t_stages, max_t
+    num_patients, t_stages, max_t, data
 ):
     num_t_stages = len(t_stages)
     stage_dist = draw_from_simplex(num_t_stages)[0]
 
     # Generate random diagnose times for each T-stage
-    tmp = np.random.randint(low=0, high=max_t, size=num_t_stages)
+    tmp = data.draw(
+        npst.arrays(dtype=int, shape=num_t_stages, elements=integers(0, max_t - 1))
+    )
     diag_times = {t_stage: tmp[i] for i,t_stage in enumerate(t_stages)}
 
     # Generate random distribution over diagnose time for each T-stage